@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+'''
+Micro-benchmarks of the conversion, data frame and network
+functions on a synthetic corpus of tweets (see synth.py),
+tracking results by commit (see benchlib.py):
+
+    python bench/bench_data.py [--lines 100000] [--nodes 300]
+
+Input files are made once for each size and seed, on
+a folder kept between runs (the system's temporary one
+by default), so later runs only time the functions.
+
+The dflib.py cases (df_filter_timestamp, df_groupsort,
+df_check and df_worldmap) require its "worldmap" module,
+which is not in this repository, and fail without it.
+Failed cases are reported and left out of the results.
+'''
+
+import argparse
+import io
+
+from contextlib import redirect_stdout
+from os import makedirs, replace
+from os.path import exists, getsize, join
+from tempfile import TemporaryDirectory, gettempdir
+from time import perf_counter
+
+from benchlib import RESULTS, print_results, rate, run_isolated, track_results
+
+def prepare(data_dir, lines=100000, seed=0):
+    '''
+    Write corpus, its conversion to CSV, a network of retweets,
+    quotes and replies as GDF and a list of place countries.
+    '''
+    import pandas as pd
+    from convert import convert_json_tweets
+    from gdflib import export_gdf
+    from synth import write_corpus
+
+    name = join(data_dir, 'corpus_' + str(lines) + '_' + str(seed))
+    files = {k: name + ext for k, ext in (('json', '.json'), ('csv', '.csv'), ('gdf', '.gdf'), ('countries', '_countries.csv'))}
+
+    if not exists(data_dir):
+        makedirs(data_dir)
+
+    if not exists(files['json']):
+        print('Writing', lines, 'tweets to', files['json'] + '...')
+        write_corpus(files['json'] + '.tmp', lines, processes=None, seed=seed)
+        convert_json_tweets(files['json'] + '.tmp', output_file=files['csv'])
+
+        df = pd.read_csv(files['csv'], dtype=str)
+        df['target'] = df['retweet_screen_name'].fillna(df['quoted_screen_name']).fillna(df['in_reply_to_screen_name'])
+        export_gdf(files['gdf'], df.dropna(subset=['target'])[['original_tweet_screen_name', 'target']].values)
+        df[['place_country']].dropna().rename(columns={'place_country': 'country'}).to_csv(files['countries'], index=False)
+
+        replace(files['json'] + '.tmp', files['json'])
+
+    return files
+
+def read_lines(input_file, n=None):
+    with open(input_file, 'rb') as f:
+        return [line for i, line in zip(range(n or 2**63), f)]
+
+def bench_load_tweet_object(input_file, n=100000, columns=None):
+    from convert import load_tweet_object
+    from jsonlib import loads
+
+    tweets = [loads(line) for line in read_lines(input_file, n)]
+
+    start = perf_counter()
+    for tweet in tweets:
+        load_tweet_object(tweet, columns=columns)
+    seconds = perf_counter() - start
+
+    return {'items': len(tweets), 'items/s': rate(len(tweets), seconds), 'seconds': round(seconds, 3)}
+
+def bench_convert(input_file, format='csv', processes=1):
+    from convert import convert_json_tweets
+
+    lines = len(read_lines(input_file))
+
+    with TemporaryDirectory() as output, redirect_stdout(io.StringIO()):
+        start = perf_counter()
+        convert_json_tweets(input_file, output_file=join(output, 'tweets.' + format),
+                            processes=processes, format=format)
+        seconds = perf_counter() - start
+
+    return {'items': lines, 'items/s': rate(lines, seconds), 'MB/s': rate(getsize(input_file) / 1024**2, seconds),
+            'seconds': round(seconds, 3)}
+
+def bench_dataframe(input_file, func='df_check', countries=None):
+    import dflib
+    import pandas as pd
+
+    df = pd.read_csv(input_file)
+    items = len(df)
+
+    if func == 'df_filter_timestamp':
+        min_date, max_date = pd.to_datetime(df['timestamp'].quantile([0.25, 0.75]), unit='s')
+        args = (df, str(min_date)[:19], str(max_date)[:19], 'timestamp')
+    elif func == 'df_groupsort':
+        df['group'] = df['original_tweet_user_id'] % 20
+        args = (df, 'group', 'retweet_count', False, 10)
+    elif func == 'df_worldmap':
+        args = (countries,)
+        items = len(pd.read_csv(countries))
+    else: # df_check() fails on columns with no values
+        args = (df.dropna(axis=1, how='all'),)
+
+    with redirect_stdout(io.StringIO()):
+        start = perf_counter()
+        getattr(dflib, func)(*args)
+        seconds = perf_counter() - start
+
+    return {'items': items, 'items/s': rate(items, seconds), 'seconds': round(seconds, 3)}
+
+def bench_read_gdf(input_file):
+    from gdflib import read_gdf
+
+    start = perf_counter()
+    G = read_gdf(input_file)
+    seconds = perf_counter() - start
+
+    return {'items': G.number_of_edges(), 'items/s': rate(G.number_of_edges(), seconds),
+            'seconds': round(seconds, 3)}
+
+def bench_nx_stats(input_file, nodes=300):
+    '''
+    Time network statistics on the largest connected
+    component of the subgraph of most connected nodes.
+    '''
+    import networkx as nx
+    from gdflib import read_gdf
+    from nxlib import nx_stats
+
+    G = read_gdf(input_file)
+    G = G.subgraph(sorted(G.nodes, key=G.degree, reverse=True)[:nodes])
+    G = G.subgraph(max(nx.connected_components(G), key=len))
+
+    with redirect_stdout(io.StringIO()):
+        start = perf_counter()
+        nx_stats(G, it=1000)
+        seconds = perf_counter() - start
+
+    return {'items': G.number_of_nodes(), 'items/s': rate(G.number_of_nodes(), seconds),
+            'seconds': round(seconds, 3)}
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmarks of conversion and data frame functions.')
+    parser.add_argument('--lines', type=int, default=100000, help='tweets on corpus')
+    parser.add_argument('--nodes', type=int, default=300, help='nodes for network statistics')
+    parser.add_argument('--seed', type=int, default=0, help='seed of corpus')
+    parser.add_argument('--data', default=join(gettempdir(), 'cpc-bench'), help='folder for input files')
+    parser.add_argument('--results', default=RESULTS, help='file to append results to')
+    args = parser.parse_args()
+
+    files = prepare(args.data, args.lines, args.seed)
+
+    results = {}
+    results['load_tweet_object'] = run_isolated(bench_load_tweet_object, files['json'])
+    results['load_tweet_object columns'] = run_isolated(bench_load_tweet_object, files['json'],
+                                                        columns=['tweet_text', 'timestamp'])
+    results['convert_json_tweets'] = run_isolated(bench_convert, files['json'])
+    results['convert_json_tweets parquet'] = run_isolated(bench_convert, files['json'], 'parquet')
+    results['convert_json_tweets processes'] = run_isolated(bench_convert, files['json'], processes=None)
+    for func in ('df_filter_timestamp', 'df_groupsort', 'df_check', 'df_worldmap'):
+        results[func] = run_isolated(bench_dataframe, files['csv'], func, files['countries'])
+    results['read_gdf'] = run_isolated(bench_read_gdf, files['gdf'])
+    results['nx_stats'] = run_isolated(bench_nx_stats, files['gdf'], args.nodes)
+
+    track_results(results, args.results, lines=args.lines, nodes=args.nodes, seed=args.seed)
+    print_results(results)
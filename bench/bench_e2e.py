@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+'''
+End-to-end throughput of collect_twitter(), stream_tweets()
+and post_tweets() against a local mock server (see
+mockapi.py), reporting tweets/s, requests/s and memory:
+
+    python bench/bench_e2e.py [--latency 0.05] [--queries 20]
+
+Results are tracked by commit as in bench_data.py.
+'''
+
+import argparse
+import io
+
+from contextlib import redirect_stdout
+from os import environ
+from tempfile import TemporaryDirectory
+from time import perf_counter
+
+from benchlib import RESULTS, print_results, rate, run_isolated, track_results
+
+def start_mock(**kwargs):
+    '''
+    Start mock server and point modules to it.
+    '''
+    import api
+    import stream
+    from mockapi import MockTwitter
+
+    environ['OAUTHLIB_INSECURE_TRANSPORT'] = '1' # plain HTTP on localhost
+
+    server = MockTwitter(**kwargs).start()
+    api.API_URL = server.url + '%s'
+    stream.STREAM_URL = server.url
+    return server
+
+def bench_collect(queries=20, limit=500, workers=1, format='csv', latency=0.05, keys=4):
+    from collect import collect_twitter
+
+    server = start_mock(latency=latency, volume=limit)
+    app_keys = [['key' + str(i), 'secret'] for i in range(keys)]
+
+    start = perf_counter()
+
+    with TemporaryDirectory() as output, redirect_stdout(io.StringIO()):
+        collect_twitter(['query' + str(i) for i in range(queries)], app_keys, format=format,
+                        output=output, limit=limit, workers=workers, quiet=True)
+
+    requests = server.counts['requests']
+    seconds = perf_counter() - start
+    return {'tweets': queries * limit,
+            'requests': requests,
+            'tweets/s': rate(queries * limit, seconds),
+            'requests/s': rate(requests, seconds)}
+
+def bench_stream(limit=2000, passthrough=False, stream_rate=5000):
+    from stream import stream_tweets
+
+    server = start_mock(stream_rate=stream_rate)
+
+    start = perf_counter()
+
+    with TemporaryDirectory() as output, redirect_stdout(io.StringIO()):
+        stream = stream_tweets('query', app_key='key', app_secret='secret', oauth_token='token',
+                               oauth_secret='secret', output=output, limit=limit,
+                               passthrough=passthrough, quiet=True)
+
+    seconds = perf_counter() - start
+    return {'tweets': stream.captured,
+            'requests': server.counts['requests'],
+            'tweets/s': rate(stream.captured, seconds)}
+
+def bench_post(batches=200, batch_size=100, sink=False):
+    from api import PostSink, post_tweets
+    from jsonlib import dumps
+    from synth import make_tweet
+
+    server = start_mock()
+    url = server.url + 'post'
+    tweets = [dumps(make_tweet(i)) for i in range(1, batch_size + 1)]
+
+    start = perf_counter()
+
+    with redirect_stdout(io.StringIO()):
+        if sink:
+            post = PostSink(url, batch_size=batch_size)
+            for i in range(batches):
+                for tweet in tweets:
+                    post.put(tweet)
+            post.close()
+        else:
+            for i in range(batches):
+                post_tweets(tweets, url)
+
+    seconds = perf_counter() - start
+    return {'tweets': server.counts['posted'],
+            'requests': batches,
+            'tweets/s': rate(server.counts['posted'], seconds),
+            'requests/s': rate(batches, seconds)}
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='End-to-end benchmarks on a mock server.')
+    parser.add_argument('--latency', type=float, default=0.05, help='seconds per request')
+    parser.add_argument('--queries', type=int, default=20, help='queries to collect')
+    parser.add_argument('--limit', type=int, default=500, help='tweets per query')
+    parser.add_argument('--results', default=RESULTS, help='file to append results to')
+    args = parser.parse_args()
+
+    results = {}
+    for workers in (1, 4):
+        results['collect workers=' + str(workers)] = run_isolated(bench_collect, args.queries, args.limit,
+                                                                  workers, latency=args.latency)
+    results['collect json'] = run_isolated(bench_collect, args.queries, args.limit, 4, 'json', args.latency)
+    results['stream'] = run_isolated(bench_stream)
+    results['stream passthrough'] = run_isolated(bench_stream, passthrough=True)
+    results['post_tweets'] = run_isolated(bench_post)
+    results['PostSink'] = run_isolated(bench_post, sink=True)
+
+    track_results(results, args.results, latency=args.latency, queries=args.queries, limit=args.limit)
+    print_results(results)
@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+'''
+Helpers for benchmarks, run from the repository root:
+
+    python bench/bench_e2e.py
+
+Each case runs on a new process, so memory is measured
+as its own peak resident set size (RSS).
+
+Results are appended to "bench/results.jsonl" with the
+current commit (and "+" if there are uncommitted changes),
+compared to the last run of each case on another commit.
+'''
+
+import platform
+import sys
+
+from datetime import datetime, timezone
+from multiprocessing import Process, Queue
+from os.path import abspath, dirname, exists, join
+from resource import RUSAGE_SELF, getrusage
+from subprocess import DEVNULL, check_output
+from time import perf_counter
+
+ROOT = dirname(dirname(abspath(__file__)))
+SRC = join(ROOT, 'src')
+RESULTS = join(ROOT, 'bench', 'results.jsonl')
+
+if SRC not in sys.path:
+    sys.path.insert(0, SRC)
+
+from jsonlib import dumps, loads
+
+def run_case(queue, func, args, kwargs):
+    start = perf_counter()
+    try:
+        result = func(*args, **kwargs) or {}
+    except Exception as e: # not timed
+        return queue.put({'error': repr(e)})
+    result.setdefault('seconds', round(perf_counter() - start, 3)) # unless timed by case
+    result['max_rss_mb'] = round(getrusage(RUSAGE_SELF).ru_maxrss / 1024, 1)
+    queue.put(result)
+
+def run_isolated(func, *args, **kwargs):
+    '''
+    Run function on a new process, returning its
+    result (a dictionary), time and peak memory.
+    '''
+    queue = Queue()
+    p = Process(target=run_case, args=(queue, func, args, kwargs))
+    p.start()
+    result = queue.get()
+    p.join()
+    return result
+
+def rate(count, seconds):
+    return round(count / seconds, 1) if seconds else None
+
+def print_results(results):
+    '''
+    Print results as a table, a line per case,
+    followed by the errors of cases that failed.
+    '''
+    passed = {name: r for name, r in results.items() if 'error' not in r}
+    keys = []
+    for r in passed.values():
+        keys += [k for k in r if k not in keys]
+    width = max(len(name) for name in results) + 2
+    print('case'.ljust(width) + ''.join(k.rjust(14) for k in keys))
+    for name, r in passed.items():
+        print(name.ljust(width) + ''.join(str(r.get(k, '')).rjust(14) for k in keys))
+    for name, r in results.items():
+        if 'error' in r:
+            print(name.ljust(width) + 'FAILED: ' + r['error'])
+
+def git_commit():
+    '''
+    Return short hash of current commit, with
+    "+" if tracked files were changed, or None.
+    '''
+    try:
+        commit = check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, stderr=DEVNULL, text=True)
+        changed = check_output(['git', 'status', '--porcelain', '--untracked-files=no'], cwd=ROOT, text=True)
+        return commit.strip() + ('+' if changed.strip() else '')
+    except Exception:
+        return None
+
+def load_results(filename=RESULTS):
+    if not exists(filename):
+        return []
+    with open(filename, 'r', encoding='utf8') as f:
+        return [loads(line) for line in f if line.strip()]
+
+def track_results(results, filename=RESULTS, **info):
+    '''
+    Append results with commit, date and info (e.g. input
+    size) to file, adding to each case the change in seconds
+    from its last run on another commit with the same info.
+    Failed cases are neither saved nor compared.
+    '''
+    commit = git_commit()
+    history = [h for h in load_results(filename) if 'error' not in h]
+    date = datetime.now(timezone.utc).strftime('%Y-%m-%d %H:%M:%S')
+
+    with open(filename, 'a', encoding='utf8') as f:
+        for case, r in results.items():
+            if 'error' in r:
+                continue
+
+            f.write(dumps(dict(case=case, commit=commit, date=date, python=platform.python_version(),
+                               **info, **r)) + '\n')
+
+            previous = [h for h in history if h['case'] == case and h.get('commit') != commit
+                        and all(h.get(k) == v for k, v in info.items())]
+
+            if previous and previous[-1].get('seconds') and r.get('seconds'):
+                r['previous'] = previous[-1]['commit']
+                r['change'] = '%+.1f%%' % ((r['seconds'] / previous[-1]['seconds'] - 1) * 100)
+
+    print('Saved results to', filename + '.')
@@ -6,86 +6,392 @@ Authenticate using Twitter's credentials as in 'config.py'.
 
 More information on API rate limits is available at:
     https://dev.twitter.com/rest/public/rate-limits
+
+Requests left are tracked locally per key and endpoint
+by a RateLimiter, updated from the response headers.
+
+Set API_URL in 'config.py' to send requests elsewhere,
+e.g. to a local mock server (see mockapi.py).
+
+App-only bearer tokens and clients are cached by key in
+memory and, if TOKEN_CACHE is set in 'config.py' as a
+file path, on disk readable only by the user.
+
+Tweets can be sent to an API endpoint with post_tweets()
+or without blocking by a PostSink, which batches them
+on keep-alive connections and spills failed batches
+to disk so they are retried later instead of lost.
 """
 
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-from requests import post
+from glob import glob
+from hashlib import sha256
+from os import O_CREAT, O_TRUNC, O_WRONLY, fdopen, getpid, makedirs, open as os_open, remove, replace
+from os.path import exists, expanduser
+from queue import Empty, Queue
+from requests import Session
+from requests.adapters import HTTPAdapter
+from threading import BoundedSemaphore, Lock, Thread
 from time import time, sleep
-from twython import Twython, TwythonRateLimitError
+from twython import Twython
 
 import mysql.connector
 
-def connect_mysql(HOST, DB, USER, PWD):
+from jsonlib import dumps, loads
+
+try: from config import TOKEN_CACHE
+except: TOKEN_CACHE = None
+
+try: # e.g. a local mock server (see mockapi.py)
+    from config import API_URL
+except: API_URL = None
+
+def connect_mysql(HOST, DB, USER, PWD, pool_size=None):
     '''
-    Connect to the MySQL database to send tweets to.
+    Connect to the MySQL database to send tweets to,
+    from a pool of connections if pool_size is set.
     '''
+    pool = {'pool_name': 'cpc_' + DB, 'pool_size': pool_size} if pool_size else {}
+
     try: db = mysql.connector.connect(host=HOST,
                                       database=DB,
                                       user=USER,
-                                      password=PWD)
+                                      password=PWD,
+                                      **pool)
 
     except Exception as e:
         print(str(e))
 
     return db
 
+# resource family, endpoint and app-only limit per 15 minutes
+RESOURCES = {
+    'tweets': ['search', '/search/tweets', 450],
+    'timeline': ['statuses', '/statuses/user_timeline', 1500],
+    'ids': ['statuses', '/statuses/lookup', 300],
+    'id': ['statuses', '/statuses/show/:id', 900],
+    'retweets': ['statuses', '/statuses/retweets/:id', 300],
+    'retweeters': ['statuses', '/statuses/retweeters/ids', 300],
+    'users': ['users', '/users/lookup', 300],
+    'user': ['users', '/users/show/:id', 900],
+    'friends': ['friends', '/friends/ids', 15],
+    'followers': ['followers', '/followers/ids', 15],
+    'trends': ['trends', '/trends/place', 75]}
+
+LIMITERS = {} # rate limiters by credentials
+
+class TokenCache():
+    '''
+    Cache app-only bearer tokens and clients by key,
+    in memory and optionally on disk (mode 600).
+    '''
+    def __init__(self, filename=None):
+        self.filename = expanduser(filename) if filename else None
+        self.clients = {}
+        self.tokens = {}
+        self.lock = Lock()
+
+        if self.filename and exists(self.filename):
+            try:
+                with open(self.filename, 'r', encoding='utf8') as f:
+                    self.tokens = loads(f.read())
+            except Exception as e:
+                print('Warning:', e)
+
+    def key(self, app_key, app_secret):
+        return sha256((app_key + ':' + app_secret).encode('utf8')).hexdigest()
+
+    def get_client(self, app_key, app_secret):
+        '''
+        Return client authenticated with cached
+        token, requesting a new one if missing.
+        '''
+        k = self.key(app_key, app_secret)
+
+        with self.lock:
+            if k not in self.clients:
+                if k not in self.tokens:
+                    twitter = twython_client(app_key, app_secret, oauth_version=2)
+                    self.tokens[k] = twitter.obtain_access_token()
+                    self.save()
+                self.clients[k] = twython_client(app_key, access_token=self.tokens[k])
+            return self.clients[k]
+
+    def invalidate(self, app_key, app_secret):
+        '''
+        Remove token, e.g. on 401 (Unauthorized).
+        '''
+        k = self.key(app_key, app_secret)
+        with self.lock:
+            self.clients.pop(k, None)
+            if self.tokens.pop(k, None):
+                self.save()
+
+    def save(self):
+        if self.filename:
+            tmp = self.filename + '.tmp'
+            with fdopen(os_open(tmp, O_WRONLY | O_CREAT | O_TRUNC, 0o600), 'w', encoding='utf8') as f:
+                f.write(dumps(self.tokens))
+            replace(tmp, self.filename)
+
+def twython_client(*args, **kwargs):
+    '''
+    Return Twython client, requesting API_URL if set
+    as in "http://127.0.0.1:8000/%s" instead of Twitter.
+    '''
+    twitter = Twython(*args, **kwargs)
+    if API_URL:
+        twitter.api_url = API_URL
+        twitter.request_token_url = API_URL % 'oauth2/token'
+    return twitter
+
+TOKENS = TokenCache(TOKEN_CACHE)
+
+class RateLimiter():
+    '''
+    Track requests left per key and endpoint locally,
+    handing out the client with the most budget left and
+    updating it from response headers, so no requests are
+    spent on checking the rate limit status.
+    '''
+    def __init__(self, app_keys, window=900):
+        self.app_keys = app_keys
+        self.window = window
+        self.clients = {}  # authenticated client per key index
+        self.budget = {}   # [remaining, limit, reset] per (key index, query type)
+        self.lock = Lock()
+
+    def client(self, i):
+        if i not in self.clients:
+            self.clients[i] = TOKENS.get_client(*self.app_keys[i][:2])
+        return self.clients[i]
+
+    def invalidate(self, twitter):
+        '''
+        Drop cached client and token of a key.
+        '''
+        i = self.key_index(twitter)
+        if i is not None:
+            self.clients.pop(i, None)
+            TOKENS.invalidate(*self.app_keys[i][:2])
+
+    def get_budget(self, i, query_type):
+        now = time()
+        budget = self.budget.get((i, query_type))
+        if not budget or budget[2] <= now: # new window
+            limit = budget[1] if budget else RESOURCES[query_type][2]
+            budget = self.budget[(i, query_type)] = [limit, limit, now + self.window]
+        return budget
+
+    def acquire(self, query_type='tweets'):
+        '''
+        Reserve a request on the key with most requests
+        left, sleeping until the earliest reset if none.
+        '''
+        while True:
+            with self.lock:
+                budgets = [(self.get_budget(i, query_type), i) for i in range(len(self.app_keys))]
+                budget, i = max(budgets, key=lambda b: b[0][0])
+                if budget[0] > 0:
+                    budget[0] -= 1
+                    break
+                tts = min(b[0][2] for b in budgets) - time() + 1
+
+            print('Warning: 0 requests left.')
+            sleep_seconds(max(tts, 1))
+
+        try: return self.client(i)
+        except Exception as e:
+            print('Warning:', e)
+            with self.lock: # skip key for this window
+                budget[0] = 0
+            return self.acquire(query_type)
+
+    def key_index(self, twitter):
+        for i, client in self.clients.items():
+            if client is twitter:
+                return i
+
+    def update(self, twitter, query_type='tweets'):
+        '''
+        Update budget from last response headers.
+        '''
+        i = self.key_index(twitter)
+        try:
+            remaining = int(twitter.get_lastfunction_header('x-rate-limit-remaining'))
+            limit = int(twitter.get_lastfunction_header('x-rate-limit-limit'))
+            reset = int(twitter.get_lastfunction_header('x-rate-limit-reset'))
+        except (TypeError, ValueError, AttributeError):
+            return
+
+        with self.lock:
+            budget = self.get_budget(i, query_type)
+            if reset > budget[2] + 1: # server window is newer
+                budget[:] = [remaining, limit, reset]
+            else: # keep local reservations
+                budget[:] = [min(remaining, budget[0]), limit, reset]
+
+    def exhausted(self, twitter, query_type='tweets'):
+        '''
+        Mark key as out of requests on rate limit errors.
+        '''
+        i = self.key_index(twitter)
+        with self.lock:
+            budget = self.get_budget(i, query_type)
+            budget[0] = 0
+            try: budget[2] = int(twitter.get_lastfunction_header('x-rate-limit-reset'))
+            except (TypeError, ValueError, AttributeError):
+                pass
+
+def rate_limiter(app_keys):
+    '''
+    Return shared rate limiter for credentials.
+    '''
+    key = tuple(tuple(k) for k in app_keys)
+    if key not in LIMITERS:
+        LIMITERS[key] = RateLimiter(app_keys)
+    return LIMITERS[key]
+
 def twython_auth(app_keys, query_type='tweets'):
     '''
-    Authenticate to Twitter using multiple credentials.
-    '''
-    resource = {
-        'tweets': ['search', '/search/tweets'],
-        'timeline': ['statuses', '/statuses/user_timeline'],
-        'ids': ['statuses', '/statuses/lookup'],
-        'id': ['statuses', '/statuses/show/:id'],
-        'retweets': ['statuses', '/statuses/retweets/:id'],
-        'retweeters': ['statuses', '/statuses/retweeters/ids'],
-        'users': ['users', '/users/lookup'],
-        'user': ['users', '/users/show/:id'],
-        'friends': ['friends', '/friends/ids'],
-        'followers': ['followers', '/followers/ids'],
-        'trends': ['trends', '/trends/place']}
-
-    rtype = resource[query_type][0]
-    rpoint = resource[query_type][1]
-    remaining = 0
-    len_app_keys = len(app_keys)
+    Authenticate to Twitter using multiple credentials,
+    returning client of the key with most requests left.
+    '''
+    return rate_limiter(app_keys).acquire(query_type)
 
-    while True:
-        tts = 900
-        rate_limit_exceeded = False
-
-        for key in app_keys:
-            try: # authenticate
-                twitter = Twython(key[0], key[1], oauth_version=2)
-                access_token = twitter.obtain_access_token()
-                twitter = Twython(key[0], access_token=access_token)
-                rate_limit_status = twitter.get_application_rate_limit_status(resources=rtype)
-                rate_limit_status = rate_limit_status['resources'][rtype][rpoint]
-                reset = rate_limit_status['reset'] - time() + 1
-                remaining = rate_limit_status['remaining']
-                limit = rate_limit_status['limit']
-
-                if remaining > 0:
-                    print('Requests left:', str(remaining) + '/' + str(limit),
-                          '(' + str(app_keys.index(key)+1) + '/' + str(len_app_keys) + ')')
-                    return twitter
-
-                elif tts > reset:
-                    tts = reset
-
-            except TwythonRateLimitError:
-                rate_limit_exceeded = True
+SESSION = Session() # keep-alive connections
+
+class PostSink():
+    '''
+    Send tweets (JSON strings) to API endpoint in batches of
+    batch_size or every flush_interval seconds, with up to
+    max_workers requests in flight and exponential backoff.
 
+    Batches failing after max_retries are saved to spill_dir
+    and sent again once the endpoint is back.
+    '''
+    def __init__(self, url, batch_size=100, flush_interval=5, max_workers=4,
+        max_retries=5, spill_dir='spill', queue_size=10000):
+
+        self.url = url
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_retries = max_retries
+        self.spill_dir = spill_dir
+        self.sent = 0     # tweets sent counter
+        self.spilled = 0  # tweets saved to disk counter
+        self.retrying = set()
+        self.lock = Lock()
+
+        self.session = Session()
+        self.session.mount(url, HTTPAdapter(pool_connections=1, pool_maxsize=max_workers))
+
+        self.queue = Queue(maxsize=queue_size)
+        self.pool = ThreadPoolExecutor(max_workers=max_workers)
+        self.in_flight = BoundedSemaphore(max_workers*2)
+
+        self.thread = Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def put(self, tweet):
+        self.queue.put(tweet)
+
+    def run(self):
+        '''
+        Collect batches from queue and submit them, retrying
+        spilled batches whenever the queue is idle.
+        '''
+        finished = False
+        tweets = []
+        deadline = time() + self.flush_interval
+
+        while not finished:
+            try:
+                tweet = self.queue.get(timeout=max(deadline - time(), 0.01))
+                if tweet is None:
+                    finished = True
+                else: tweets.append(tweet)
+            except Empty:
+                self.retry_spilled() if not tweets else None
+
+            if tweets and (finished or len(tweets) >= self.batch_size or time() >= deadline):
+                self.submit(tweets)
+                tweets = []
+
+            if time() >= deadline:
+                deadline = time() + self.flush_interval
+
+    def submit(self, tweets, spill_file=None):
+        self.in_flight.acquire() # <-- limit pending batches
+        future = self.pool.submit(self.send, tweets, spill_file)
+        future.add_done_callback(lambda f: self.in_flight.release())
+
+    def send(self, tweets, spill_file=None):
+        '''
+        Post batch with exponential backoff, saving it
+        to disk if all retries fail.
+        '''
+        for i in range(self.max_retries):
+            try:
+                response = self.session.post(self.url, data=dumps(tweets),
+                                             headers={'Content-Type': 'application/json'},
+                                             timeout=30)
+                if response.ok:
+                    with self.lock:
+                        self.sent += len(tweets)
+                    if spill_file:
+                        remove(spill_file)
+                        self.retrying.discard(spill_file)
+                    return True
+                error = response.status_code
             except Exception as e:
-                #raise # <-- uncomment line if bug-hunting
-                print('Warning:', e)
+                error = e
+            if i < self.max_retries - 1: # not after last attempt
+                sleep(min(2**i, 60))
+
+        print('Warning: error sending tweets to API endpoint (' + str(error) + ').')
+        if spill_file:
+            self.retrying.discard(spill_file)
+        else: self.spill(tweets)
+        return False
+
+    def spill(self, tweets):
+        if not exists(self.spill_dir):
+            makedirs(self.spill_dir)
+        name = self.spill_dir + '/' + str(int(time()*1000)) + '_' + str(getpid()) + '_' + str(id(tweets)) + '.json'
+        with open(name + '.tmp', 'w', encoding='utf8') as f:
+            f.write(dumps(tweets))
+        replace(name + '.tmp', name) # <-- never a partial batch
+        with self.lock:
+            self.spilled += len(tweets)
 
-        if remaining == 0:
-            print('Warning: 0 requests left.')\
-                if rate_limit_exceeded else None
+    def retry_spilled(self):
+        '''
+        Submit one batch saved to disk, if any,
+        moving unreadable files aside.
+        '''
+        for spill_file in sorted(glob(self.spill_dir + '/*.json')):
+            if spill_file not in self.retrying:
+                try:
+                    with open(spill_file, 'r', encoding='utf8') as f:
+                        tweets = loads(f.read())
+                except (OSError, ValueError) as e:
+                    print('Warning: skipping spilled batch ' + spill_file + ' (' + str(e) + ').')
+                    try: replace(spill_file, spill_file + '.bad')
+                    except OSError: pass
+                    continue
+                self.retrying.add(spill_file)
+                self.submit(tweets, spill_file)
+                break
 
-            sleep_seconds(tts)
+    def close(self):
+        '''
+        Send remaining tweets and wait for requests.
+        '''
+        self.queue.put(None)
+        self.thread.join()
+        self.pool.shutdown(wait=True)
 
 def post_tweets(array, url, max_retries=3):
     '''
@@ -94,15 +400,20 @@ def post_tweets(array, url, max_retries=3):
     count = 0
     while True:
         if count == max_retries:
-            break
+            print('\nWarning: dropped', len(array), 'tweets after', max_retries, 'retries.')
+            return False
         count += 1
-        response = post(url, json=array)
+        try: response = SESSION.post(url, data=dumps(array),
+                                     headers={'Content-Type': 'application/json'})
+        except Exception as e:
+            response = e
         print(response)
-        if '200' not in str(response):
+        if not getattr(response, 'ok', False):
             print('\nWarning: error sending tweets to API endpoint.')
             # print(response) # <-- uncomment to print response error
-            sleep_seconds(3)
-        else: break
+            if count < max_retries: # not after last attempt
+                sleep_seconds(3)
+        else: return True
 
 def sleep_seconds(tts):
     '''
@@ -14,6 +14,14 @@ TWITTER_KEYS = [
 ['my_key', 'my_secret']
 ]
 
+# optional file to cache bearer tokens
+# TOKEN_CACHE = '~/.cpc_tokens.json'
+
+# optional URLs to send requests to instead of Twitter,
+# e.g. a local mock server (see mockapi.py)
+# API_URL = 'http://127.0.0.1:8000/%s'
+# STREAM_URL = 'http://127.0.0.1:8000/'
+
 TWITTER_TOKENS = [
 ['my_key',
 'my_secret',
@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+'''
+Store collection state per query as JSON lines, so an
+interrupted run resumes from the last page written:
+
+    'q' - query string (or IDs joined by commas)
+    'since_id' - most recent ID to start capturing
+    'first_id' - most recent ID captured this round
+    'max_id' - oldest ID to continue capturing from
+    'cursor' - next cursor on retweeters/friends/followers
+    'captured' - number of tweets captured this round
+    'done' - whether the query has finished this round
+
+Only the last line of each query is kept on loading,
+and the file is rewritten with those lines only.
+'''
+
+from os import fsync, replace
+from os.path import exists
+from threading import Lock
+
+from jsonlib import dumps, loads
+
+class Checkpoint():
+    '''
+    Query states read from file and updated on
+    every page, flushed to disk before returning.
+    '''
+    def __init__(self, filename):
+        self.filename = filename
+        self.states = {}
+        self.lock = Lock()
+
+        if exists(filename):
+            with open(filename, 'rb') as f:
+                for line in f:
+                    if line.endswith(b'\n'): # skip partial lines
+                        state = loads(line)
+                        self.states[state['q']] = state
+            self.compact()
+
+        self.f = open(filename, 'a', encoding='utf8')
+
+    def compact(self):
+        with open(self.filename + '.tmp', 'w', encoding='utf8') as f:
+            for state in self.states.values():
+                f.write(dumps(state) + '\n')
+        replace(self.filename + '.tmp', self.filename)
+
+    def get(self, q):
+        '''
+        Return copy of query state or None.
+        '''
+        state = self.states.get(query_key(q))
+        return dict(state) if state else None
+
+    def update(self, q, **kwargs):
+        with self.lock:
+            state = self.states.setdefault(query_key(q), {'q': query_key(q)})
+            state.update(kwargs)
+            self.f.write(dumps(state) + '\n')
+            self.f.flush()
+            fsync(self.f.fileno())
+
+    def close(self):
+        self.f.close()
+
+def query_key(q):
+    '''
+    Return query as string, e.g. a chunk of IDs.
+    '''
+    return ','.join(str(x) for x in q) if isinstance(q, list) else str(q)
@@ -26,26 +26,68 @@ Available extension formats for output writing:
     'json' - full output returned from Twitter
     'csv' - store only selected data from tweets
     'txt' - dehydrated output like IDs only
+    'parquet' - typed columnar output as in 'csv'
+
+Set columns to a list of fields from HEADER_TWEETS (or
+HEADER_USERS) to write only those in the CSV output.
+
+Set compression as 'gzip' or 'zstd' (or use an output
+file ending in ".gz" or ".zst") for compressed output.
+
+Set database as a DatabaseSink (see sqllib.py) to also
+upsert tweets or users to a MySQL or SQLite database.
+
+Set workers to collect that many queries in parallel,
+each request on the key with most requests left and
+all results written to the same output file.
+
+Set wait_time in seconds to keep polling for new tweets,
+each query from its own most recent ID and on its own
+interval, halved while returning full pages and doubled
+while returning none (between min_wait and max_wait).
+
+Statuses are written on a background thread in batches
+as returned, with progress shown unless quiet=True.
+
+Set checkpoint to a file path to store the state of each
+query after every page (see checkpoint.py), so runs
+resume where they stopped, appending to the output.
+
+Set pack=True to search 'tweets' with single terms packed
+into OR-combined queries (see planner.py), writing the
+terms each tweet matches as its "search_string".
+
+Use hydrate_ids() (see hydrate.py) for ID files too
+large to read in memory.
+
+Users are looked up in hundreds. Set user_cache as a
+UserCache (see sqllib.py) to store users seen on tweets
+or lookups, writing those still fresh without requests.
 
 More information on query operators is available at:
     https://dev.twitter.com/rest/public/search
 """
 
-import json
-
 from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from csv import writer, QUOTE_MINIMAL
 from os import makedirs
 from os.path import abspath, splitext
 from os.path import exists, isfile
+from queue import Full, Queue
+from threading import Event, Thread
 from time import time, sleep
 from tqdm import tqdm
 #from twython import Twython, TwythonError
-from twython import TwythonRateLimitError
+from twython import TwythonAuthError, TwythonRateLimitError
 
-from api import twython_auth, post_tweets, sleep_seconds
+from api import RESOURCES, PostSink, rate_limiter, sleep_seconds
+from checkpoint import Checkpoint
 from convert import HEADER_TWEETS, load_tweet_object
 from convert import HEADER_USERS, load_user_object
+from jsonlib import dumps
+from planner import match_terms, pack_queries
+from ziplib import SUFFIXES, open_file
 
 try: from config import TWITTER_KEYS
 except: TWITTER_KEYS = []
@@ -54,6 +96,10 @@ def collect_twitter(query,
     app_keys=TWITTER_KEYS,
     query_type='tweets',
     format='csv',
+    checkpoint=None,
+    columns=None,
+    compression=None,
+    database=None,
     output='.',
     output_file=None,
     geocode=None,
@@ -61,36 +107,24 @@ def collect_twitter(query,
     lang=None,
     limit=0,
     max_id=None,
+    pack=False,
     post_url=None,
+    quiet=False,
     separator=None,
     since_id=None,
+    user_cache=None,
     wait_time=None,
+    min_wait=5,
+    max_wait=None,
+    workers=1,
     write_output=True):
 
-    is_split = False # query as split flag
-    last_date = None # last captured date
-    maximum = None   # last captured ID
-    max_retries = 3  # skip when reaching number
-    current = 0      # current ongoing query
-    total = 0        # total tweets captured
-    tts = 900        # time to sleep if error on endpoint
-    count = 100      # number of tweets in each query
+    count = 100 # number of tweets in each query
 
     if limit and limit < count:
         count = limit # set tweets max limit to receive
 
-    if isinstance(query, str):
-        # read from file
-        if isfile(query):
-            query_strings = []
-            with open(query, 'rt', encoding='utf8') as f:
-                for line in f:
-                    query_strings.append(line.rstrip('\n'))
-            query = list(OrderedDict.fromkeys(query_strings).keys())
-        # transform to list
-        else: query = query.split(separator) if separator else [query]
-
-    int_len_query = len(query) # read total count
+    query = read_query(query, separator)
 
     # default format and extension
     if query_type in ('retweeters', 'friends', 'followers'):
@@ -100,12 +134,188 @@ def collect_twitter(query,
     header = HEADER_TWEETS
     if query_type.startswith('user'):
         header = HEADER_USERS
+    if columns: # selected fields only
+        header = columns
 
     # output paths
     if not exists(output):
         makedirs(output)
     if not output_file:
         output_file = output+'/'+query_type+'.'+format
+        output_file += SUFFIXES.get(compression, '') if format != 'parquet' else ''
+
+    # split IDs into hundreds
+    if query_type == 'ids':
+        query = list(split_list(query, count))
+
+    # skip users recently seen
+    cached = []
+    if user_cache and query_type in ('users', 'user'):
+        cached, query = user_cache.split(query, is_user_id)
+
+    # lookup users in hundreds
+    if query_type == 'users' or (query_type == 'user' and len(query) > 1):
+        query = list(split_list(query, 100))
+        query_type = 'users'
+
+    # search options per query
+    options = [{'lang': lang, 'geocode': geocode, 'terms': None}] * len(query)
+
+    # pack terms into fewer searches
+    if pack and query_type == 'tweets':
+        plan = pack_queries(query, lang=lang, geocode=geocode)
+        query = [p[0] for p in plan]
+        options = [{'lang': p[1], 'geocode': p[2], 'terms': p[3]} for p in plan]
+
+    # log into Twitter
+    limiter = rate_limiter(app_keys)
+
+    # send tweets in background
+    sink = PostSink(post_url, batch_size=10, spill_dir=output+'/spill') if post_url else None
+
+    # resume from stored states
+    store = Checkpoint(checkpoint) if checkpoint else None
+    states = [(store.get(q) if store else None) or {'since_id': since_id} for q in query]
+    append = bool(store and exists(output_file))
+
+    if format == 'parquet':
+        from pqlib import ParquetRowWriter
+        if append: # keep previous file
+            output_file = next_file(output_file)
+        f = ParquetRowWriter(output_file, header, compression=compression or 'snappy')
+    else: f = open_file(output_file, 'at' if append else 'wt', compression, newline='')
+
+    stop = Event()
+
+    with f:
+        out = StatusWriter(f, format, query_type, columns, write_output, sink, database, user_cache, quiet=quiet)
+        out.writeheader(header) if format == 'csv' and not append else None
+        out.write(cached, cache=False)
+
+        kwargs = dict(limiter=limiter, writer=out, query_type=query_type, count=count,
+                      is_user_id=is_user_id, limit=limit, max_id=max_id, checkpoint=store, stop=stop)
+        indexes = list(range(len(query))) # queries due
+        intervals = [wait_time] * len(query)
+        due = [0] * len(query)
+        pool = None
+
+        try:
+            while True:
+                if workers > 1: # run queries in parallel
+                    pool = ThreadPoolExecutor(max_workers=workers)
+                    futures = [pool.submit(collect_query, query[i], state=states[i], **options[i], **kwargs) for i in indexes]
+                    results = [future.result() for future in futures]
+                    pool.shutdown()
+                else: results = [collect_query(query[i], state=states[i], **options[i], **kwargs) for i in indexes]
+
+                for i, state in zip(indexes, results):
+                    states[i] = state
+
+                if not isinstance(wait_time, int):
+                    break
+
+                print('Got', sum(s.get('captured', 0) for s in results),
+                      'tweets. Last:', out.last_date, 'ID:', results[-1].get('max_id') if results else None)
+
+                # adapt intervals to volume and budget
+                for i in indexes:
+                    intervals[i] = next_interval(intervals[i], states[i].get('captured', 0), count,
+                                                 min_wait, max_wait or wait_time * 16)
+                intervals = budget_intervals(intervals, len(app_keys) * RESOURCES[query_type][2] / limiter.window)
+
+                # start next round from most recent IDs
+                for i in indexes:
+                    due[i] = time() + intervals[i]
+                    states[i] = {'since_id': states[i].get('first_id') or states[i].get('since_id')}
+
+                sleep_seconds(max(min(due) - time(), 0))
+                indexes = [i for i in range(len(query)) if due[i] <= time()]
+
+        except KeyboardInterrupt:
+            print('Finishing...')
+            stop.set()
+            if pool: # wait for queries to stop
+                pool.shutdown(cancel_futures=True)
+            out.close()
+            store.close() if store else None
+            sink.close() if sink else None
+            database.commit() if database else None
+            return
+
+        finally: # stop queries left and write statuses returned
+            stop.set()
+            if pool:
+                pool.shutdown(cancel_futures=True)
+            out.close()
+
+    if store:
+        store.close()
+
+    if user_cache:
+        user_cache.commit()
+
+    if sink: # wait for pending requests
+        sink.close()
+
+    if database: # commit remaining rows
+        database.commit()
+
+    first = next((s for s in states if s.get('first_id')), {})
+    last = states[-1] if states else {}
+
+    if out.total == 1 and isinstance(out.last_status, dict) and not query_type.startswith('user'):
+        status = out.last_status
+        text = status['full_text'] if 'full_text' in status else status['text']
+        user = status['user']['screen_name']
+        url = 'https://twitter.com/'+user+'/'+str(first.get('first_id'))
+        print('Got 1 tweet from @' + user + '.\nURL:'+url+'\n'+text)
+
+    elif out.total > 1:
+        print('\nGot', out.total, 'total', ('tweets' if query_type == 'timeline' else query_type) + '.',
+              '\nFirst:', first.get('first_id'),
+              '\nLast:', last.get('max_id'),
+              '\nSince:', first.get('first_date'),
+              '\nUntil:', out.last_date)
+
+def collect_query(q,
+    limiter,
+    writer,
+    query_type='tweets',
+    count=100,
+    geocode=None,
+    is_user_id=False,
+    lang=None,
+    limit=0,
+    max_id=None,
+    terms=None,
+    state=None,
+    checkpoint=None,
+    stop=None):
+    '''
+    Collect a single query page by page from its state,
+    writing statuses and returning the updated state.
+
+    Set terms as the list of terms packed in the query
+    to write those matched by each tweet.
+    '''
+    state = state or {}
+
+    if state.get('done'): # finished before resuming
+        return state
+
+    is_split = isinstance(q, list) # query as split flag
+    max_retries = 3         # skip when reaching number
+    captured = state.get('captured', 0)     # number of tweets captured in this query
+    cursor = state.get('cursor', -1)        # navigate from query to query
+    first_id = state.get('first_id')        # first captured ID for future searches
+    first_date = state.get('first_date')    # first ID captured date string
+    int_retries = 0         # counter to stop retrying query
+    maximum = state.get('max_id', max_id)   # oldest tweet to finish capturing
+    since_id = minimum = state.get('since_id') # most recent tweet to start capturing
+    finished = False        # flag to mark when done collecting
+    previous_cursor = None  # iterate through results
+    previous_results = None # compare returned output
+    search_results = None   # returned output itself
 
     # error messages to re-authenticate
     auth_on = ['429 (Too Many Requests)']
@@ -118,219 +328,345 @@ def collect_twitter(query,
     # error messages to sleep on return
     sleep_on = ['503 (Service Unavailable)']
 
-    # split IDs into hundreds
-    if query_type == 'ids':
-        query = split_list(query, count)
-        int_len_query = int(int_len_query/count)
-        is_split = True
-
-    # log into Twitter
-    twitter = twython_auth(app_keys, query_type)
-    sleep(0.25)
-
-    with open(output_file, 'w', newline='', encoding='utf8') as f:
-        file_writer = writer(f, delimiter=',', quoting=QUOTE_MINIMAL)
-        file_writer.writerow(header) if format == 'csv' else None
-
+    while not (stop and stop.is_set()): # keep searching
+        try: # collecting
+            twitter = limiter.acquire(query_type)
+
+            if query_type == 'tweets':
+                search_results = twitter.search(q=q,
+                                    tweet_mode='extended',
+                                    count=count,
+                                    lang=lang,
+                                    max_id=maximum,
+                                    since_id=minimum,
+                                    geocode=geocode)
+                search_results = search_results['statuses']
+
+            elif query_type == 'timeline':
+                search_results = twitter.get_user_timeline(screen_name=q if not is_user_id else None,
+                                    user_id=q if is_user_id else None,
+                                    tweet_mode='extended',
+                                    count=count,
+                                    max_id=maximum,
+                                    since_id=minimum)
+
+            elif query_type == 'users':
+                search_results = twitter.lookup_user(screen_name=q if not is_user_id else None,
+                                    user_id=q if is_user_id else None,
+                                    include_entities=False)
+
+            elif query_type == 'user':
+                search_results = twitter.show_user(screen_name=q if not is_user_id else None,
+                                    user_id=q if is_user_id else None,
+                                    include_entities=False)
+                search_results = [search_results] # <-- to list
+
+            elif query_type == 'ids':
+                search_results = twitter.lookup_status(id=q,
+                                    tweet_mode='extended')
+
+            elif query_type == 'id':
+                search_results = twitter.show_status(id=q,
+                                    tweet_mode='extended')
+                search_results = [search_results] # <-- to list
+
+            elif query_type == 'retweets':
+                search_results = twitter.get_retweets(id=q,
+                                    tweet_mode='extended')
+
+            elif query_type == 'retweeters':
+                search_results = twitter.get_retweeters_ids(id=q,
+                                    count=count,
+                                    cursor=cursor)
+                cursor = search_results['next_cursor']
+                search_results = search_results['ids']
+
+            elif query_type == 'friends':
+                search_results = twitter.get_friends_ids(id=q,
+                                    count=count,
+                                    cursor=cursor)
+                cursor = search_results['next_cursor']
+                search_results = search_results['ids']
+
+            elif query_type == 'followers':
+                search_results = twitter.get_followers_ids(id=q,
+                                    count=count,
+                                    cursor=cursor)
+                cursor = search_results['next_cursor']
+                search_results = search_results['ids']
+
+            # requests left from headers
+            limiter.update(twitter, query_type)
+
+            # check if the output is new
+            if (previous_results == search_results):
+                finished = True
+                checkpoint.update(q, done=True) if checkpoint else None
+                break
+
+            # write returned tweets
+            writer.write(search_results, terms)
+            captured += len(search_results)
+
+            for status in search_results:
+                if isinstance(status, dict) and 'id' in status:
+                    maximum = (status['id'] - 1)
+                    if not first_id:
+                        first_id = status['id']
+                        first_date = status['created_at'].replace(' +0000','') if 'created_at' in status else None
+
+            cond1 = is_split
+            cond2 = (not search_results) or (cursor == 0)
+            cond3 = (limit and limit != 0 and captured >= limit)
+            cond4 = (max_id and int(maximum) >= int(max_id))
+            # page back from newest until reaching since_id
+            cond5 = (since_id and (len(search_results) < count or int(maximum) <= int(since_id)))
+            cond6 = (previous_cursor == cursor) and (previous_results == search_results)
+
+            finished = any(c for c in [cond1,cond2,cond3,cond4,cond5,cond6])
+
+            if checkpoint: # store state after page is written
+                writer.flush()
+                checkpoint.update(q, since_id=since_id, first_id=first_id, first_date=first_date,
+                    max_id=maximum, cursor=cursor, captured=captured, done=bool(finished))
+
+            if finished:
+                break
+
+            previous_cursor = cursor
+            previous_results = search_results
+
+        except TwythonRateLimitError:
+            limiter.exhausted(twitter, query_type)
+
+        except TwythonAuthError as e:
+            if 'token' not in str(e).lower(): # protected user
+                print('Warning:', str(e))
+                break
+            limiter.invalidate(twitter) # expired token
+            int_retries += 1
+            if int_retries == max_retries:
+                break
+
+        except Exception as e:
+            raise # <-- uncomment this line if bug-hunting!
+
+            int_retries += 1
+            print('Warning:', str(e))
+
+            if int_retries == max_retries\
+            or any(x in str(e) for x in break_on):
+                break
+
+            elif any(x in str(e) for x in auth_on):
+                limiter.exhausted(twitter, query_type)
+
+            elif any(x in str(e) for x in sleep_on):
+                sleep_seconds(15)
+
+    return {'since_id': since_id,
+            'first_id': first_id,
+            'first_date': first_date,
+            'max_id': maximum,
+            'cursor': cursor,
+            'captured': captured,
+            'done': finished}
+
+class StatusWriter():
+    '''
+    Write statuses to output file, API endpoint and
+    database on a background thread, in batches as put
+    by write() from any query, showing progress.
+    '''
+    def __init__(self, f, format='csv', query_type='tweets', columns=None,
+        write_output=True, sink=None, database=None, user_cache=None,
+        queue_size=100, quiet=False):
+        self.f = f
+        self.format = format
+        self.query_type = query_type
+        self.columns = columns
+        self.write_output = write_output
+        self.sink = sink
+        self.database = database
+        self.user_cache = user_cache
+        self.file_writer = f if format == 'parquet' else writer(f, delimiter=',', quoting=QUOTE_MINIMAL)
+        self.last_date = None   # last captured date
+        self.last_status = None # last captured status
+        self.total = 0          # total tweets captured
+        self.closed = False
+        self.error = None
+        self.queue = Queue(maxsize=queue_size)
+        self.progress = tqdm(desc='Collecting', unit=' ' + ('tweets' if query_type in ('tweets', 'timeline') else query_type),
+                             mininterval=1, ascii=True, disable=quiet)
+        self.thread = Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def writeheader(self, header):
+        self.file_writer.writerow(header)
+
+    def write(self, statuses, terms=None, cache=True):
+        if self.error:
+            raise self.error
+        while statuses and not self.closed and self.thread.is_alive():
+            try: return self.queue.put((statuses, terms, cache), timeout=1)
+            except Full: # writer is behind
+                pass
+
+    def run(self):
         while True:
-            #t = tqdm(query, ascii=True, total=int_len_query, desc='Collecting')
-            for q in query:
-                current += (len(q) if is_split else 1)
-                captured = 0            # number of tweets captured in this query
-                cursor = 0              # navigate from query to query
-                finished = False        # flag to mark when done collecting
-                first_id = None         # first captured ID for future searches
-                first_date = None       # first ID captured date string
-                int_retries = 0         # counter to stop retrying query
-                maximum = max_id        # oldest tweet to finish capturing
-                minimum = since_id      # most recent tweet to start capturing
-                previous_cursor = None  # iterate through results
-                previous_results = None # compare returned output
-                search_results = None   # returned output itself
-
-                # if query_type in ('tweets', 'users', 'userids'):
-                #     print('\nCollecting', ('"' + q + '"' if query_type == 'tweets' else ('@' + q + ' timeline')),
-                #           '(' + str(current) + '/' + str(len(query)) + ')...')
-
-                while True: # keep searching
-                    try: # collecting
-                        if query_type == 'tweets':
-                            search_results = twitter.search(q=q,
-                                                tweet_mode='extended',
-                                                count=count,
-                                                lang=lang,
-                                                max_id=maximum,
-                                                since_id=minimum,
-                                                geocode=geocode)
-                            search_results = search_results['statuses']
-
-                        elif query_type == 'timeline':
-                            search_results = twitter.get_user_timeline(screen_name=q if not is_user_id else None,
-                                                user_id=q if is_user_id else None,
-                                                tweet_mode='extended',
-                                                count=count,
-                                                max_id=maximum,
-                                                since_id=minimum)
-
-                        elif query_type == 'users':
-                            search_results = twitter.lookup_user(screen_name=q if not is_user_id else None,
-                                                user_id=q if is_user_id else None,
-                                                include_entities=False)
-
-                        elif query_type == 'user':
-                            search_results = twitter.show_user(screen_name=q if not is_user_id else None,
-                                                user_id=q if is_user_id else None,
-                                                include_entities=False)
-                            search_results = [search_results] # <-- to list
-
-                        elif query_type == 'ids':
-                            search_results = twitter.lookup_status(id=q,
-                                                tweet_mode='extended')
-
-                        elif query_type == 'id':
-                            search_results = twitter.show_status(id=q,
-                                                tweet_mode='extended')
-                            search_results = [search_results] # <-- to list
-
-                        elif query_type == 'retweets':
-                            search_results = twitter.get_retweets(id=q,
-                                                tweet_mode='extended')
-
-                        elif query_type == 'retweeters':
-                            seach_results = twitter.get_retweeters_ids(id=q,
-                                                count=count,
-                                                cursor=cursor)
-                            cursor = search_results['next_cursor']
-                            search_results = search_results['ids']
-
-                        elif query_type == 'friends':
-                            seach_results = twitter.get_friends_ids(id=q,
-                                                count=count,
-                                                cursor=cursor)
-                            cursor = search_results['next_cursor']
-                            search_results = search_results['ids']
-
-                        elif query_type == 'followers':
-                            seach_results = twitter.get_followers_ids(id=q,
-                                                count=count,
-                                                cursor=cursor)
-                            cursor = search_results['next_cursor']
-                            search_results = search_results['ids']
-
-                        # check if the output is new
-                        if (previous_results == search_results):
-                            break
-
-                        # iterate through returned tweets
-                        for some_results in split_list(search_results, 10):
-                            statuses = [] # array to store and send tweets
-
-                            for status in some_results:
-                                captured += 1 # data returned from this query
-                                total += 1 # data returned from all queries
-
-                                tweet_text = status['full_text'].replace("\n", "")
-                                tweet_username = '@' + status['user']['screen_name']
-                                print(tweet_username, str(' ')*int(20-len(tweet_username)), tweet_text, '(' + status['id_str'] + ')')
-
-                                if post_url:
-                                    tweet = json.dumps(status)
-                                    statuses.append(tweet)
-
-                                if write_output:
-
-                                    if format == 'json':
-                                        # write output data to JSON file
-                                        json.dump(status, f, sort_keys=True)#, indent=4)
-                                        f.write('\n')
-
-                                    elif format == 'csv':
-                                        # load data and write to CSV file
-                                        if query_type in ('users', 'user'):
-                                            row = load_user_object(status)
-                                        else: row = load_tweet_object(status)#, redux=True)
-                                        file_writer.writerow(row)
-
-                                    elif format == 'txt':
-                                        # write output IDs to text file
-                                        if 'id' in status:
-                                            f.write(str(status['id'])+'\n')
-                                        else: f.write(status+'\n')
-
-                                if 'id' in status:
-                                    maximum = (status['id'] - 1)
-                                    if not first_id:
-                                        first_id = status['id']
-
-                                if 'created_at' in status:
-                                    last_date = status['created_at'].replace(' +0000','')
-                                    if not first_date:
-                                        first_date = status['created_at'].replace(' +0000','')
-
-                            if post_url: # send to API endpoint
-                                post_tweets(statuses, post_url)
-
-                        #t.set_description("Collecting (%i total)" % total)
-                        #t.refresh()
-
-                        cond1 = is_split
-                        cond2 = (not search_results)
-                        cond3 = (limit and limit != 0 and captured >= limit)
-                        cond4 = (max_id and int(maximum) >= int(max_id))
-                        cond5 = (since_id and int(minimum) <= int(since_id))
-                        cond6 = (previous_cursor == cursor) and (previous_results == search_results)
-
-                        if any(c for c in [cond1,cond2,cond3,cond4,cond5,cond6]):
-                            break
-
-                        previous_cursor = cursor
-                        previous_results = search_results
-
-                    except TwythonRateLimitError:
-                        twitter = twython_auth(app_keys, query_type)
-
-                    except KeyboardInterrupt:
-                        print('Finishing...'); return
-
-                    except Exception as e:
-                        raise # <-- uncomment this line if bug-hunting!
-
-                        int_retries += 1
-                        print('Warning:', str(e))
-
-                        if int_retries == max_retries\
-                        or any(x in str(e) for x in break_on):
-                            break
-
-                        elif any(x in str(e) for x in auth_on):
-                            twitter = twython_auth(api_keys, query_type)
-
-                        elif any(x in str(e) for x in sleep_on):
-                            sleep_seconds(15)
-
-            if isinstance(wait_time, int):
-                since_id = first_id
-                print('Got', total if query_type in ('ids', 'reweeters') else captured,
-                      'tweets. Last:', last_date, 'ID:', maximum)
-                sleep_seconds(wait_time)
-            else: break
+            batch = self.queue.get()
+            try:
+                if batch is None:
+                    break
+                if isinstance(batch, Event): # flush request
+                    if self.format != 'parquet' and not self.error: # keep row groups
+                        self.f.flush()
+                elif not self.error:
+                    self.write_batch(*batch)
+            except Exception as e:
+                self.error = e
+            finally:
+                batch.set() if isinstance(batch, Event) else None
+                self.queue.task_done()
+
+    def write_batch(self, statuses, terms=None, cache=True):
+        rows = []
+        lines = []
+
+        for status in statuses:
+            self.total += 1 # data returned from all queries
+            self.last_status = status
+
+            if not isinstance(status, dict): # user IDs
+                lines.append(str(status)+'\n')
+                continue
+
+            # serialize once for both file and endpoint
+            if self.sink or (self.write_output and self.format == 'json'):
+                tweet = dumps(status, sort_keys=True)
+
+            if self.sink: # send to API endpoint
+                self.sink.put(tweet)
+
+            # attribute tweet to packed terms
+            search_string = match_terms(status, terms) if terms else ''
+
+            if self.database: # write to database
+                self.database.write_status(status, search_string)
+
+            if self.user_cache and cache: # store users seen
+                if self.query_type in ('users', 'user'):
+                    self.user_cache.put([status])
+                else: self.user_cache.put_tweet(status)
+
+            if self.write_output:
+
+                if self.format == 'json':
+                    # write output data to JSON file
+                    lines.append(tweet + '\n')
+
+                elif self.format in ('csv', 'parquet'):
+                    # load data and write to CSV/Parquet file
+                    if self.query_type in ('users', 'user'):
+                        rows.append(load_user_object(status, columns=self.columns))
+                    else: rows.append(load_tweet_object(status, search_string, columns=self.columns))#, redux=True)
+
+                elif self.format == 'txt':
+                    # write output IDs to text file
+                    lines.append(str(status['id'])+'\n')
+
+            if 'created_at' in status:
+                self.last_date = status['created_at'].replace(' +0000','')
+
+        if self.write_output: # one write per batch
+            self.file_writer.writerows(rows) if rows else None
+            self.f.write(''.join(lines)) if lines else None
+
+        self.progress.update(len(statuses))
+
+    def flush(self):
+        '''
+        Wait for batches put to be written and flushed
+        by the writer thread, raising if it was closed.
+        '''
+        done = Event()
+        while not self.closed and self.thread.is_alive():
+            try:
+                self.queue.put(done, timeout=1)
+                break
+            except Full:
+                pass
+        while self.thread.is_alive() and not done.wait(1):
+            pass # <-- until flushed or stopped
+        if self.error:
+            raise self.error
+        if not done.is_set():
+            raise RuntimeError('Writer closed before flushing.')
+
+    def close(self):
+        '''
+        Write batches left and stop thread.
+        '''
+        if not self.closed:
+            self.closed = True
+            self.queue.put(None)
+            self.thread.join()
+            self.progress.close()
+        if self.error:
+            raise self.error
+
+def next_interval(interval, captured, count=100, min_wait=5, max_wait=None):
+    '''
+    Halve polling interval if a full page was returned,
+    double it if none, within min_wait and max_wait.
+    '''
+    if captured >= count:
+        interval /= 2
+    elif not captured:
+        interval *= 2
+    return max(min_wait, min(interval, max_wait or interval))
 
-    if total == 1 and header == HEADER_TWEETS:
-        text = status['full_text'] if 'full_text' in status else status['text']
-        user = status['user']['screen_name']
-        url = 'https://twitter.com/'+user+'/'+str(first_id)
-        print('Got 1 tweet from @' + user + '.\nURL:'+url+'\n'+text)
+def budget_intervals(intervals, rate):
+    '''
+    Stretch polling intervals so expected requests
+    per second stay within 90% of the rate limit.
+    '''
+    expected = sum(1/i for i in intervals)
+    if expected > rate * 0.9:
+        return [i * expected / (rate * 0.9) for i in intervals]
+    return intervals
+
+def read_query(query, separator=None):
+    '''
+    Read queries from file (unique lines)
+    or split string by separator to list.
+    '''
+    if isinstance(query, str):
+        # read from file
+        if isfile(query):
+            query_strings = []
+            with open(query, 'rt', encoding='utf8') as f:
+                for line in f:
+                    query_strings.append(line.rstrip('\n'))
+            query = list(OrderedDict.fromkeys(query_strings).keys())
+        # transform to list
+        else: query = query.split(separator) if separator else [query]
+    return query
 
-    elif total > 1:
-        print('\nGot', total, 'total', ('tweets' if query_type == 'timeline' else query_type) + '.',
-              '\nFirst:', first_id,
-              '\nLast:', maximum,
-              '\nSince:', first_date,
-              '\nUntil:', last_date)
+def next_file(filename):
+    '''
+    Return first file name not taken
+    as in "name_1.ext", "name_2.ext".
+    '''
+    name, ext = splitext(filename)
+    i = 1
+    while exists(name + '_' + str(i) + ext):
+        i += 1
+    return name + '_' + str(i) + ext
 
 def split_list(iterable, chunksize=100):
     '''
     Split an array in iterables of N items.
     '''
-    for i,c in enumerate(iterable[::chunksize]):
-        yield iterable[i*chunksize:(i+1)*chunksize]
\ No newline at end of file
+    for i in range(0, len(iterable), chunksize):
+        yield iterable[i:i+chunksize]
@@ -6,13 +6,21 @@ This module contains the legacy function for
 converting tweet objects to array of strings.
 '''
 
-import json
 import time
 
+from collections import namedtuple
 from csv import writer, QUOTE_MINIMAL
 from datetime import datetime
-from os import getpid
-from os.path import basename, exists, splitext
+from functools import lru_cache
+from glob import glob
+from multiprocessing import Pool, cpu_count
+from os import getpid, remove
+from os.path import basename, exists, getsize, isdir, splitext
+from shutil import copyfileobj
+
+from jsonlib import loads
+from rotate import MANIFEST
+from ziplib import SUFFIXES, get_compression, open_file, strip_compression
 
 HEADER_TWEETS = ['tweet_text', 'retweet_count', 'favorite_count', 'followers_count', 'original_tweet_screen_name',
     'retweet_screen_name', 'original_tweet_created_at', 'retweet_created_at', 'retweet_id', 'original_tweet_id',
@@ -25,51 +33,264 @@ HEADER_USERS = ['screen_name', 'id_str', 'name', 'statuses_count', 'followers_co
     'favourites_count', 'created_at', 'lang', 'location', 'time_zone', 'description', 'url', 'protected',
     'default_profile', 'default_profile_image', 'verified']
 
-def convert_json_tweets(input_file, delimiter=',', output_file=None, redux=False):
+DTYPES_TWEETS = {'retweet_count': 'int64', 'favorite_count': 'int64', 'followers_count': 'int64',
+    'original_tweet_created_at': 'datetime64[s]', 'retweet_created_at': 'datetime64[s]',
+    'quoted_created_at': 'datetime64[s]', 'is_retweet': 'bool', 'timestamp': 'int64'}
+
+# fields requiring each optional step in load_tweet_object()
+FIELDS_CREATED = {'original_tweet_created_at', 'timestamp'}
+FIELDS_PLACE = {'place_name', 'place_fullname', 'place_country', 'place_cc', 'place_bb'}
+FIELDS_MEDIA = {'media_url', 'media_expanded_url'}
+FIELDS_REPLY = {'type', 'in_reply_to_status_id', 'in_reply_to_screen_name', 'in_reply_to_user_id'}
+FIELDS_QUOTED = {'retweet_count', 'favorite_count', 'followers_count', 'type', 'quoted_id',
+    'quoted_screen_name', 'quoted_user_id', 'quoted_created_at', 'quoted_coordinates'}
+FIELDS_RETWEET = FIELDS_QUOTED | {'retweet_screen_name', 'retweet_created_at', 'retweet_id',
+    'retweet_coordinates', 'retweet_user_id', 'is_retweet'}
+
+TweetPlan = namedtuple('TweetPlan', ['text', 'created', 'source', 'place', 'media', 'reply', 'retweet', 'quoted', 'index'])
+
+MONTHS = {'Jan': 1, 'Feb': 2, 'Mar': 3, 'Apr': 4, 'May': 5, 'Jun': 6,
+    'Jul': 7, 'Aug': 8, 'Sep': 9, 'Oct': 10, 'Nov': 11, 'Dec': 12}
+
+def convert_json_tweets(input_file, delimiter=',', output_file=None, redux=False,
+    processes=1, chunk_size=64*1024**2, split_output=False, columns=None, format='csv',
+    compression=None):
     '''
-    Convert a JSON streaming dataset to CSV format
+    Convert a JSON streaming dataset to CSV format (or
+    'parquet', also set by the output file extension)
     using the above load_tweet_object() function.
+
+    Input and output files may be gzip or zstd compressed,
+    as set by their extension or the compression argument.
+
+    Accepts a file, a directory or a glob pattern of
+    shards as input. Setting processes > 1 (or None for
+    all CPUs) splits each file into newline-aligned byte
+    ranges of chunk_size bytes converted by a pool of
+    workers, whose outputs are then merged in order to
+    a single CSV or kept as ordered part files if
+    split_output is set.
+
+    Set columns as a list of fields from HEADER_TWEETS
+    to compute and write only the selected ones.
     '''
     int_valid_lines = 0
+    header = columns or HEADER_TWEETS
+    input_files = list_input_files(input_file)
+
+    if output_file and output_file.endswith('.parquet'):
+        format = 'parquet'
 
     if not output_file:
-        output_file = basename(input_file).replace('.json','.csv')
+        output_file = strip_compression(basename(input_file.rstrip('/'))).replace('.json','')
+        output_file = output_file.replace('*','').strip('_.') or 'tweets'
+        output_file = output_file + '.' + format
+        output_file += SUFFIXES.get(compression, '') if format != 'parquet' else ''
 
     if exists(output_file):
         # append process ID and timestamp
-        file_name, file_ext = splitext(output_file)
+        file_name, file_ext = splitext(strip_compression(output_file))
+        file_ext += output_file[len(file_name + file_ext):]
         str_unique = str(getpid()) + '_' + str(int(time.time()))
         output_file = file_name + '_' + str_unique + file_ext
         print('Warning: output file set as', output_file + '.')
 
     print('Converting', input_file + '...')
 
-    with open(output_file, 'w', newline='', encoding='utf8') as csvfile:
+    if processes == 1 and not split_output and format == 'parquet':
+        from pqlib import ParquetRowWriter
+
+        with ParquetRowWriter(output_file, header) as file_writer:
+            for f in input_files:
+                with open_file(f, 'rb') as tweet_file:
+                    int_valid_lines += convert_lines(tweet_file, file_writer, columns=columns)
+
+        print('Read', int_valid_lines, 'valid tweets.')
+        return output_file
+
+    if processes == 1 and not split_output:
+        with open_file(output_file, 'wt', compression, newline='') as csvfile:
+            file_writer = writer(csvfile, delimiter=delimiter, quoting=QUOTE_MINIMAL)
+            file_writer.writerow(header)
+
+            for f in input_files:
+                with open_file(f, 'rb') as tweet_file:
+                    int_valid_lines += convert_lines(tweet_file, file_writer, redux=redux, columns=columns)
+
+        print('Read', int_valid_lines, 'valid tweets.')
+        return output_file
+
+    file_name, file_ext = splitext(strip_compression(output_file))
+    ranges = []
+
+    for f in input_files:
+        for start, end in split_byte_ranges(f, chunk_size):
+            part_file = file_name + '_' + str(len(ranges)).zfill(5) + file_ext
+            ranges.append((f, start, end, part_file, delimiter, redux, split_output, columns, format))
+
+    with Pool(processes or cpu_count()) as pool:
+        parts = []
+        for part_file, int_lines in pool.imap(convert_byte_range, ranges):
+            parts.append(part_file)
+            int_valid_lines += int_lines
+
+    if not split_output and format == 'parquet':
+        from pqlib import merge_parquet
+        merge_parquet(parts, output_file, header)
+        for part_file in parts:
+            remove(part_file)
+
+    elif not split_output:
+        with open_file(output_file, 'wt', compression, newline='') as csvfile:
+            writer(csvfile, delimiter=delimiter, quoting=QUOTE_MINIMAL).writerow(header)
+            for part_file in parts:
+                with open(part_file, 'r', newline='', encoding='utf8') as f:
+                    copyfileobj(f, csvfile)
+                remove(part_file)
+
+    print('Read', int_valid_lines, 'valid tweets.')
+    return output_file if not split_output else parts
+
+def convert_lines(lines, file_writer, redux=False, columns=None):
+    '''
+    Write JSON lines in bytes as CSV rows
+    and return the number of tweets read.
+    '''
+    int_valid_lines = 0
+
+    for tweet in lines:
+        tweet = loads(tweet)
+        tweet = load_tweet_object(tweet, redux=redux, columns=columns)
+        file_writer.writerow(tweet)
+        int_valid_lines += 1
+
+    return int_valid_lines
+
+def convert_byte_range(args):
+    '''
+    Convert a byte range from a JSON file to a CSV
+    part file, called from a pool of worker processes.
+    '''
+    input_file, start, end, part_file, delimiter, redux, header, columns, format = args
+
+    def read_lines(f):
+        f.seek(start) if start else None
+        while end is None or f.tell() < end:
+            line = f.readline()
+            if not line:
+                break
+            yield line
+
+    if format == 'parquet':
+        from pqlib import ParquetRowWriter
+
+        with ParquetRowWriter(part_file, columns or HEADER_TWEETS) as file_writer:
+            with open_file(input_file, 'rb') as tweet_file:
+                int_valid_lines = convert_lines(read_lines(tweet_file), file_writer, columns=columns)
+
+        return part_file, int_valid_lines
+
+    with open(part_file, 'w', newline='', encoding='utf8') as csvfile:
         file_writer = writer(csvfile, delimiter=delimiter, quoting=QUOTE_MINIMAL)
-        file_writer.writerow(HEADER_TWEETS)
+        file_writer.writerow(columns or HEADER_TWEETS) if header else None
+
+        with open_file(input_file, 'rb') as tweet_file:
+            int_valid_lines = convert_lines(read_lines(tweet_file), file_writer, redux=redux, columns=columns)
+
+    return part_file, int_valid_lines
+
+def split_byte_ranges(input_file, chunk_size=64*1024**2):
+    '''
+    Split a file in (start, end) byte offsets of
+    roughly chunk_size, aligned to line endings.
+    Compressed files are read whole as (0, None).
+    '''
+    if get_compression(input_file):
+        return [(0, None)]
+
+    ranges = []
+    size = getsize(input_file)
+    start = 0
+
+    with open(input_file, 'rb') as f:
+        while start < size:
+            f.seek(min(start + chunk_size, size))
+            f.readline() # <-- move to next line break
+            end = min(f.tell(), size)
+            ranges.append((start, end))
+            start = end
+
+    return ranges
 
-        with open(input_file, 'rb') as tweet_file:
+def read_json_tweets(input_file):
+    '''
+    Yield tweet objects from a JSON streaming dataset,
+    read from a file, directory or glob pattern.
+    '''
+    for f in list_input_files(input_file):
+        with open_file(f, 'rb') as tweet_file:
             for tweet in tweet_file:
-                tweet = tweet.decode('utf8', 'ignore')
-                tweet = json.loads(tweet)
-                tweet = load_tweet_object(tweet, redux=redux)
-                file_writer.writerow(tweet)
-                int_valid_lines += 1
+                yield loads(tweet)
 
-    print('Read', int_valid_lines, 'valid tweets.')
+def list_input_files(input_file):
+    '''
+    Return a sorted list of files from a file, glob
+    pattern or directory, on which only finished tweet
+    segments are listed (not its manifest, unfinished
+    ".part" files or spilled batches).
+    '''
+    if isdir(input_file):
+        return sorted(f for f in glob(input_file.rstrip('/') + '/*')
+                      if not isdir(f) and basename(f) != MANIFEST
+                      and strip_compression(f).endswith(('.json', '.jsonl')))
+    if exists(input_file):
+        return [input_file]
+    return sorted(glob(input_file))
+
+def load_tweet_columns(tweets, search_string='', format='list', columns=None):
+    '''
+    Read an iterable of tweet objects into columns keyed
+    by HEADER_TWEETS, as lists (default), typed NumPy
+    arrays ('numpy') or a Pandas data frame ('pandas').
+    '''
+    header = columns or HEADER_TWEETS
+    values = [[] for c in header]
+    appends = [v.append for v in values]
+
+    for tweet in tweets:
+        for append, value in zip(appends, load_tweet_object(tweet, search_string, columns=columns)):
+            append(value)
 
-def load_tweet_object(tweet, search_string='', legacy=False, redux=False):
+    if format == 'list':
+        return dict(zip(header, values))
+
+    import numpy as np
+
+    arrays = {}
+    for name, v in zip(header, values):
+        arrays[name] = np.array(v, dtype=DTYPES_TWEETS.get(name, object))
+
+    if format == 'numpy':
+        return arrays
+
+    import pandas as pd
+    return pd.DataFrame(arrays, columns=header)
+
+def load_tweet_object(tweet, search_string='', legacy=False, redux=False, columns=None):
     '''
     Read Twitter data returned from API.
+
+    Set columns as a list of fields from HEADER_TWEETS to
+    return only those, skipping the work for the rest.
     '''
-    tweet_text = (tweet['full_text']\
-                 if 'full_text' in tweet\
-                 else tweet['text'])\
-                 .replace('\n', ' ')\
-                 .replace('\r', ' ')
+    plan = tweet_plan(tuple(columns) if columns else None)
 
+    tweet_text = None
     tweet_type = 'Tweet'
     is_retweet = False
+    source = None
+    tweet_created_at = None
+    timestamp = None
 
     place_name = None
     place_fullname = None
@@ -79,8 +300,6 @@ def load_tweet_object(tweet, search_string='', legacy=False, redux=False):
 
     media_url = None
     media_expanded_url = None
-    media_source_status_id = None
-    media_source_status_user_id = None
 
     in_reply_to_status_id = None
     in_reply_to_screen_name = None
@@ -98,102 +317,102 @@ def load_tweet_object(tweet, search_string='', legacy=False, redux=False):
     quoted_created_at = None
     quoted_screen_name = None
 
+    user = tweet['user']
     favorite_count = tweet['favorite_count']
     retweet_count = tweet['retweet_count']
-    followers_count = tweet['user']['followers_count']
+    followers_count = user['followers_count']
     lang = tweet['lang']
 
     tweet_id = tweet['id_str']
-    tweet_screen_name = tweet['user']['screen_name']
-    tweet_user_id = tweet['user']['id_str']
+    tweet_screen_name = user['screen_name']
+    tweet_user_id = user['id_str']
     tweet_coordinates = tweet['coordinates']
-    tweet_created_at = time.strftime('%Y-%m-%d %H:%M:%S',
-        time.strptime(tweet['created_at'], '%a %b %d %H:%M:%S +0000 %Y'))
 
-    timestamp = int(datetime.strptime(tweet['created_at'], "%a %b %d %H:%M:%S +0000 %Y").timestamp())
+    retweeted_status = tweet.get('retweeted_status')
+    quoted_status = tweet.get('quoted_status')
+
+    if retweeted_status and 'quoted_status' in retweeted_status:
+        quoted_status = retweeted_status['quoted_status']
+
+    if plan.text or redux:
+        tweet_text = (tweet['full_text']\
+                     if 'full_text' in tweet\
+                     else tweet['text'])\
+                     .replace('\n', ' ')\
+                     .replace('\r', ' ')
+
+    if plan.created or redux:
+        tweet_created_at, timestamp = parse_created_at(tweet['created_at'])
 
     if redux: # get only fields required for TSM
         return [tweet_screen_name, tweet_text.replace(","," "), time.strftime("%x", time.gmtime(timestamp))]
 
-    source = tweet['source']
-    head, sep, tail = source.partition('<')
-    head, sep, tail = source.partition('>')
-    source = tail.replace('</a>', '')
-
-    if 'place' in tweet and tweet['place']:
-        place_name = tweet['place']['name']
-        place_fullname = tweet['place']['full_name']
-        place_country = tweet['place']['country']
-        place_cc = tweet['place']['country_code']
+    if plan.source:
+        source = tweet['source']
+        head, sep, tail = source.partition('>')
+        source = tail.replace('</a>', '')
+
+    if plan.place and tweet.get('place'):
+        place = tweet['place']
+        place_name = place['name']
+        place_fullname = place['full_name']
+        place_country = place['country']
+        place_cc = place['country_code']
         if 'bounding_box' in tweet and 'coordinates' in tweet['bounding_box']:
-            place_bb = tweet['place']['bounding_box']['coordinates']
-
-    if 'coordinates' in tweet and tweet['coordinates']:
-        tweet_coordinates = tweet['coordinates']
+            place_bb = place['bounding_box']['coordinates']
 
-    if 'entities' in tweet and tweet['entities']:
-        if 'media' in tweet['entities'] and tweet['entities']['media']:
+    if plan.media and tweet.get('entities'):
+        if tweet['entities'].get('media'):
             media_url = tweet['entities']['media'][0]['media_url']
             media_expanded_url = tweet['entities']['media'][0]['expanded_url']
 
-    if tweet['in_reply_to_status_id']:
+    if plan.reply and tweet['in_reply_to_status_id']:
         tweet_type = 'reply'
         in_reply_to_status_id = tweet['in_reply_to_status_id_str']
         in_reply_to_screen_name = tweet['in_reply_to_screen_name']
         in_reply_to_user_id = tweet['in_reply_to_user_id_str']
 
-    if 'retweeted_status' in tweet:
+    if plan.retweet and retweeted_status:
         is_retweet = True
         tweet_type = 'retweet'
 
-        rt_text = (tweet['retweeted_status']['full_text']\
-                  if 'full_text' in tweet['retweeted_status']\
-                  else tweet['retweeted_status']['text'])\
-                  .replace('\n', ' ')\
-                  .replace('\r', ' ')
+        favorite_count = retweeted_status['favorite_count']
+        retweet_count = retweeted_status['retweet_count']
+        followers_count = retweeted_status['user']['followers_count']
 
-        favorite_count = tweet['retweeted_status']['favorite_count']
-        retweet_count = tweet['retweeted_status']['retweet_count']
-        followers_count = tweet['retweeted_status']['user']['followers_count']
+        retweet_id = retweeted_status['id_str']
+        retweet_screen_name = retweeted_status['user']['screen_name']
+        retweet_user_id  = retweeted_status['user']['id_str']
+        retweet_coordinates = retweeted_status['coordinates']
+        retweet_created_at = parse_created_at(retweeted_status['created_at'])[0]
 
-        retweet_id = tweet['retweeted_status']['id_str']
-        retweet_screen_name = tweet['retweeted_status']['user']['screen_name']
-        retweet_user_id  = tweet['retweeted_status']['user']['id_str']
-        retweet_coordinates = tweet['retweeted_status']['coordinates']
-        retweet_created_at = time.strftime('%Y-%m-%d %H:%M:%S',
-            time.strptime(tweet['retweeted_status']['created_at'], '%a %b %d %H:%M:%S +0000 %Y'))
-
-        if 'quoted_status' in tweet['retweeted_status']:
-            tweet['quoted_status'] = tweet['retweeted_status']['quoted_status']
-
-    if 'quoted_status' in tweet:
+    if plan.quoted and quoted_status:
         tweet_type = 'quote'
 
-        quoted_text = (tweet['quoted_status']['full_text']\
-                      if 'full_text' in tweet['quoted_status']\
-                      else tweet['quoted_status']['text'])\
-                      .replace('\n', ' ')\
-                      .replace('\r', ' ')
+        favorite_count = quoted_status['favorite_count']
+        retweet_count = quoted_status['retweet_count']
+        followers_count = quoted_status['user']['followers_count']
 
-        favorite_count = tweet['quoted_status']['favorite_count']
-        retweet_count = tweet['quoted_status']['retweet_count']
-        followers_count = tweet['quoted_status']['user']['followers_count']
-
-        quoted_id = tweet['quoted_status']['id_str']
-        quoted_screen_name = tweet['quoted_status']['user']['screen_name']
-        quoted_user_id  = tweet['quoted_status']['user']['id_str']
-        quoted_coordinates = tweet['quoted_status']['coordinates']
-        quoted_created_at = time.strftime('%Y-%m-%d %H:%M:%S',
-            time.strptime(tweet['quoted_status']['created_at'],'%a %b %d %H:%M:%S +0000 %Y'))
+        quoted_id = quoted_status['id_str']
+        quoted_screen_name = quoted_status['user']['screen_name']
+        quoted_user_id  = quoted_status['user']['id_str']
+        quoted_coordinates = quoted_status['coordinates']
+        quoted_created_at = parse_created_at(quoted_status['created_at'])[0]
 
     # ensure full text workaround
-    if tweet_text.endswith('…')\
+    if plan.text\
+    and tweet_text.endswith('…')\
     and tweet_text.startswith('RT @'):
-        a,b = tweet_text.rstrip('…').split(': ',1)
-        if tweet_type == 'retweet' and rt_text.startswith(b):
-            tweet_text = str(a+': '+rt_text)
-        elif tweet_type == 'quote' and quoted_text.startswith(b):
-            tweet_text = str(a+': '+quoted_text)
+        original = quoted_status or retweeted_status # as tweet type
+        if original:
+            original_text = (original['full_text']\
+                            if 'full_text' in original\
+                            else original['text'])\
+                            .replace('\n', ' ')\
+                            .replace('\r', ' ')
+            a,b = tweet_text.rstrip('…').split(': ',1)
+            if original_text.startswith(b):
+                tweet_text = str(a+': '+original_text)
 
     data = [tweet_text, retweet_count, favorite_count, followers_count, tweet_screen_name, retweet_screen_name,
             tweet_created_at, retweet_created_at, retweet_id, tweet_id, tweet_coordinates, retweet_coordinates,
@@ -207,11 +426,53 @@ def load_tweet_object(tweet, search_string='', legacy=False, redux=False):
     #     if type(data[i]) == dict:
     #         data[i] = str(data[i])
 
+    if plan.index:
+        return [data[i] for i in plan.index]
+
     return data[:15] if legacy else data
 
-def load_user_object(user):
+@lru_cache(maxsize=128)
+def tweet_plan(columns=None):
+    '''
+    Return steps of load_tweet_object() required by
+    selected columns (all if None) and their positions.
+    '''
+    fields = set(columns or HEADER_TWEETS)
+    return TweetPlan(text='tweet_text' in fields,
+                     created=bool(fields & FIELDS_CREATED),
+                     source='source' in fields,
+                     place=bool(fields & FIELDS_PLACE),
+                     media=bool(fields & FIELDS_MEDIA),
+                     reply=bool(fields & FIELDS_REPLY),
+                     retweet=bool(fields & FIELDS_RETWEET),
+                     quoted=bool(fields & FIELDS_QUOTED),
+                     index=column_index(columns) if columns else None)
+
+@lru_cache(maxsize=128)
+def column_index(columns, header=tuple(HEADER_TWEETS)):
+    '''
+    Return positions of selected columns in header.
+    '''
+    return [header.index(c) for c in columns]
+
+@lru_cache(maxsize=4096)
+def parse_created_at(created_at):
+    '''
+    Return date string and local timestamp from a
+    "created_at" field, e.g. "Mon Oct 01 12:00:05 +0000 2019",
+    avoiding the cost of strptime() on every call.
+    '''
+    try:
+        d = datetime(int(created_at[26:30]), MONTHS[created_at[4:7]], int(created_at[8:10]),
+                     int(created_at[11:13]), int(created_at[14:16]), int(created_at[17:19]))
+    except (KeyError, ValueError):
+        d = datetime.strptime(created_at, '%a %b %d %H:%M:%S +0000 %Y')
+    return d.strftime('%Y-%m-%d %H:%M:%S'), int(d.timestamp())
+
+def load_user_object(user, columns=None):
     '''
     Read user data returned from API.
+    Set columns to select fields from HEADER_USERS.
     '''
     screen_name = user['screen_name']
     id_str = user['id_str']
@@ -246,4 +507,7 @@ def load_user_object(user):
             listed_count, favourites_count, created_at, lang, location, time_zone,
             description, url, protected, default_profile, default_profile_image, verified]
 
+    if columns:
+        return [data[i] for i in column_index(tuple(columns), tuple(HEADER_USERS))]
+
     return data
\ No newline at end of file
@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+'''
+Crawl follower or friend networks breadth-first from
+seed users up to a depth, writing edges to a GDF file
+as they are returned (see gdflib.py):
+
+    crawl_network(['user1', 'user2'], query_type='followers', depth=2)
+
+The frontier and visited users are kept on a SQLite
+file with the cursor of each user, saved after every
+page with the size of the GDF file, so interrupted crawls
+resume where they stopped without repeating edges.
+Requests are made on the key with most requests left,
+waiting for the rate limit window to reset if none.
+
+Edges go from follower to followed user, and nodes
+are named by user ID.
+'''
+
+from concurrent.futures import ThreadPoolExecutor
+from os import makedirs, truncate
+from os.path import exists, getsize
+from twython import TwythonAuthError, TwythonError, TwythonRateLimitError
+
+import sqlite3
+
+from api import rate_limiter
+from gdflib import GDFWriter
+
+try: from config import TWITTER_KEYS
+except: TWITTER_KEYS = []
+
+def crawl_network(seeds,
+    app_keys=TWITTER_KEYS,
+    query_type='followers',
+    depth=1,
+    is_user_id=False,
+    max_pages=None,
+    output='.',
+    output_file=None,
+    state_file=None,
+    workers=1):
+    '''
+    Crawl users from seeds, expanding users up to depth
+    (1 for seeds only), with up to max_pages of 5000 IDs
+    each per user, returning number of edges written.
+    '''
+    if not exists(output):
+        makedirs(output)
+
+    output_file = output_file or output + '/' + query_type + '.gdf'
+    state_file = state_file or output + '/' + query_type + '.db'
+    limiter = rate_limiter(app_keys)
+    edges = 0
+
+    db = sqlite3.connect(state_file)
+    db.execute('CREATE TABLE IF NOT EXISTS nodes (id VARCHAR(32) PRIMARY KEY, depth INT,'
+               ' cursor BIGINT DEFAULT -1, pages INT DEFAULT 0, done BOOLEAN DEFAULT 0)')
+    db.execute('CREATE TABLE IF NOT EXISTS meta (key VARCHAR(32) PRIMARY KEY, value)')
+
+    if not is_user_id: # name nodes by ID
+        seeds = lookup_ids(limiter, seeds)
+
+    db.executemany('INSERT OR IGNORE INTO nodes (id, depth) VALUES (?, 0)', [(str(s),) for s in seeds])
+    db.commit()
+
+    # drop edges written after the last page saved
+    size = db.execute("SELECT value FROM meta WHERE key='gdf_size'").fetchone()
+    if size and exists(output_file) and getsize(output_file) > size[0]:
+        truncate(output_file, size[0])
+
+    with GDFWriter(output_file) as out,\
+         ThreadPoolExecutor(max_workers=workers) as pool:
+
+        while True:
+            frontier = db.execute('SELECT id, depth, cursor, pages FROM nodes WHERE done=0'
+                                  ' ORDER BY depth, rowid LIMIT ?', (workers,)).fetchall()
+            if not frontier:
+                break
+
+            pages = pool.map(lambda node: get_page(limiter, query_type, node[0], node[2]), frontier)
+
+            for (user_id, user_depth, cursor, n), (ids, next_cursor) in zip(frontier, pages):
+                ids = [str(i) for i in ids]
+
+                # follower -> followed user
+                if query_type == 'followers':
+                    out.writerows((i, user_id) for i in ids)
+                else: out.writerows((user_id, i) for i in ids)
+                out.flush()
+                edges += len(ids)
+
+                if user_depth + 1 < depth: # add to frontier
+                    db.executemany('INSERT OR IGNORE INTO nodes (id, depth) VALUES (?, ?)',
+                                   [(i, user_depth + 1) for i in ids])
+
+                done = (next_cursor == 0) or bool(max_pages and n + 1 >= max_pages)
+                db.execute('UPDATE nodes SET cursor=?, pages=?, done=? WHERE id=?',
+                           (next_cursor, n + 1, done, user_id))
+                db.execute("INSERT OR REPLACE INTO meta VALUES ('gdf_size', ?)", (getsize(output_file),))
+                db.commit() # <-- cursor with its edges
+
+            visited, left = db.execute('SELECT SUM(done), SUM(1-done) FROM nodes').fetchone()
+            print('Got', edges, 'edges,', visited, 'users crawled and', left, 'left.')
+
+    db.close()
+    return edges
+
+def get_page(limiter, query_type, user_id, cursor=-1, max_retries=3):
+    '''
+    Return IDs and next cursor of a user, skipping
+    those not found or protected (next cursor as 0).
+    '''
+    retries = 0
+
+    while True:
+        twitter = limiter.acquire(query_type)
+        try:
+            if query_type == 'followers':
+                results = twitter.get_followers_ids(user_id=user_id, cursor=cursor, count=5000)
+            else: results = twitter.get_friends_ids(user_id=user_id, cursor=cursor, count=5000)
+            limiter.update(twitter, query_type)
+            return results['ids'], results['next_cursor']
+
+        except TwythonRateLimitError:
+            limiter.exhausted(twitter, query_type)
+
+        except TwythonAuthError as e:
+            if 'token' not in str(e).lower(): # protected user
+                return [], 0
+            limiter.invalidate(twitter)
+            retries += 1
+
+        except TwythonError as e:
+            print('Warning:', str(e))
+            if e.error_code == 404:
+                return [], 0
+            retries += 1
+
+        if retries >= max_retries:
+            print('Warning: skipping user', user_id)
+            return [], 0
+
+def lookup_ids(limiter, screen_names):
+    '''
+    Return user IDs from screen names.
+    '''
+    ids = []
+    for i in range(0, len(screen_names), 100):
+        twitter = limiter.acquire('users')
+        users = twitter.lookup_user(screen_name=screen_names[i:i+100], include_entities=False)
+        limiter.update(twitter, 'users')
+        ids.extend(u['id_str'] for u in users)
+    return ids
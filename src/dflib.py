@@ -17,6 +17,7 @@ from os.path import abspath, isfile, splitext
 from sys import getsizeof
 from time import time
 
+from convert import load_tweet_columns, read_json_tweets
 from worldmap import WORLDMAP
 
 def df_write(df, output_file, index_label='', overwrite=False):
@@ -30,6 +31,20 @@ def df_write(df, output_file, index_label='', overwrite=False):
     df.to_csv(output_file, index_label=index_label)
     return output_file
 
+def df_read_tweets(input_file, search_string=''):
+    '''
+    Read a JSON streaming dataset (file, directory or glob)
+    to a typed data frame, with no CSV conversion needed.
+    '''
+    return load_tweet_columns(read_json_tweets(input_file), search_string, format='pandas')
+
+def df_read_parquet(input_file, columns=None, filters=None):
+    '''
+    Read only the selected columns and matching
+    row groups from a Parquet file to data frame.
+    '''
+    return pd.read_parquet(input_file, columns=columns, filters=filters)
+
 def df_concat(lst, axis=0, ignore_index=False, sort=False):
     '''
     Concatenate and returns data frame
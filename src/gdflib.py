@@ -8,6 +8,7 @@ Functions for handling Graph Data Format (GDF).
 import networkx as nx
 
 from csv import reader, writer
+from os.path import exists, getsize
 
 NODES = ['nodedef>name VARCHAR']
 EDGES = ['edgedef>node1 VARCHAR', 'node2 VARCHAR']
@@ -30,6 +31,42 @@ def export_gdf(filename, network=[], header_nodes=[], header_edges=[], directed=
             row.append(directed)
             file_writer.writerow(row)
 
+class GDFWriter():
+    '''
+    Write edges to a GDF file as they come, in the
+    format of export_gdf(), appending if it exists.
+    '''
+    def __init__(self, filename, header_nodes=[], header_edges=[], directed=True):
+        is_new = not exists(filename) or not getsize(filename)
+        self.directed = directed
+        self.graphfile = open(filename, 'a', newline='', encoding='utf8')
+        self.file_writer = writer(self.graphfile, delimiter=',')
+
+        if is_new:
+            self.file_writer.writerow(NODES + header_nodes)
+            self.file_writer.writerow(EDGES + header_edges + ['directed BOOLEAN'])
+
+    def writerow(self, line):
+        row = list(line)
+        row.append(self.directed)
+        self.file_writer.writerow(row)
+
+    def writerows(self, network):
+        for line in network:
+            self.writerow(line)
+
+    def flush(self):
+        self.graphfile.flush()
+
+    def close(self):
+        self.graphfile.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
 def read_gdf(filename):
     '''
     Read GDF and returns graph object from networkx.
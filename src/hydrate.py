@@ -0,0 +1,194 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+'''
+Hydrate large files of tweet IDs (one per line, plain
+or compressed) with memory use bounded by run_size and
+the number of requests in flight, not by input size.
+
+IDs are read in runs sorted as 64-bit integers and kept
+on temporary files, then merged skipping duplicates.
+Lookups of 100 IDs are sent by several workers, each on
+the key with most requests left, writing tweets as JSON
+lines to segments rotated by max_bytes (see rotate.py).
+
+IDs not returned (deleted, protected or not found) are
+written to "missing.txt" and those failing after retries
+to "failed.txt" on the output folder.
+'''
+
+from array import array
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from heapq import merge
+from itertools import islice
+from os import makedirs, remove
+from os.path import exists, join
+from tempfile import mkstemp
+from twython import TwythonAuthError, TwythonRateLimitError
+
+import numpy as np
+
+from api import rate_limiter
+from jsonlib import dumps
+from rotate import RotatingFile
+from ziplib import open_file
+
+try: from config import TWITTER_KEYS
+except: TWITTER_KEYS = []
+
+def hydrate_ids(input_file,
+    app_keys=TWITTER_KEYS,
+    output='.',
+    name='tweets.json',
+    compression=None,
+    max_bytes=256*1024**2,
+    max_retries=3,
+    run_size=5000000,
+    tmp_dir=None,
+    workers=4):
+    '''
+    Write tweets from unique IDs on input file,
+    returning number of IDs found and missing.
+    '''
+    if not exists(output):
+        makedirs(output)
+
+    limiter = rate_limiter(app_keys)
+    out = RotatingFile(output, name, max_bytes=max_bytes, compression=compression)
+    runs = sort_runs(input_file, run_size, tmp_dir or output)
+    found = 0
+    missing = 0
+    batches = 0
+
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as pool,\
+             open(join(output, 'missing.txt'), 'a') as f_missing,\
+             open(join(output, 'failed.txt'), 'a') as f_failed:
+
+            pending = set()
+            chunks = iter_chunks(unique_ids(runs), 100)
+
+            for chunk in chunks:
+                pending.add(pool.submit(lookup_ids, limiter, chunk, max_retries))
+
+                if len(pending) >= workers * 2: # bounded in flight
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        found, missing = write_results(future.result(), out, f_missing, f_failed, found, missing)
+                        batches += 1
+                        if batches % 100 == 0:
+                            print('Got', found, 'tweets,', missing, 'missing.')
+
+            for future in pending:
+                found, missing = write_results(future.result(), out, f_missing, f_failed, found, missing)
+
+    finally:
+        out.close()
+        for run in runs:
+            remove(run)
+
+    print('\nGot', found, 'tweets,', missing, 'missing.')
+    return found, missing
+
+def lookup_ids(limiter, ids, max_retries=3):
+    '''
+    Return tweets, missing and failed IDs.
+    '''
+    retries = 0
+
+    while True:
+        twitter = limiter.acquire('ids')
+        try:
+            tweets = twitter.lookup_status(id=ids, tweet_mode='extended')
+            limiter.update(twitter, 'ids')
+            returned = set(t['id'] for t in tweets)
+            return tweets, [i for i in ids if i not in returned], []
+
+        except TwythonRateLimitError:
+            limiter.exhausted(twitter, 'ids')
+
+        except TwythonAuthError: # expired token
+            limiter.invalidate(twitter)
+            retries += 1
+
+        except Exception as e:
+            print('Warning:', str(e))
+            retries += 1
+
+        if retries >= max_retries:
+            return [], [], ids
+
+def write_results(results, out, f_missing, f_failed, found, missing):
+    tweets, not_found, failed = results
+
+    for tweet in tweets:
+        out.write((dumps(tweet) + '\n').encode('utf8'))
+
+    for i in not_found:
+        f_missing.write(str(i) + '\n')
+
+    for i in failed:
+        f_failed.write(str(i) + '\n')
+
+    return found + len(tweets), missing + len(not_found)
+
+def sort_runs(input_file, run_size=5000000, tmp_dir='.'):
+    '''
+    Read IDs to sorted runs of run_size
+    on temporary files, returning paths.
+    '''
+    runs = []
+    ids = array('Q')
+
+    with open_file(input_file, 'rt') as f:
+        for line in f:
+            line = line.strip()
+            if line.isdigit():
+                ids.append(int(line))
+                if len(ids) >= run_size:
+                    runs.append(write_run(ids, tmp_dir))
+                    ids = array('Q')
+
+    if ids:
+        runs.append(write_run(ids, tmp_dir))
+
+    return runs
+
+def write_run(ids, tmp_dir='.'):
+    fd, path = mkstemp(suffix='.ids', dir=tmp_dir)
+    with open(fd, 'wb') as f:
+        np.sort(np.frombuffer(ids, dtype=np.uint64)).tofile(f)
+    return path
+
+def read_run(path, buffer_size=65536):
+    '''
+    Yield IDs from a run file in blocks.
+    '''
+    with open(path, 'rb') as f:
+        while True:
+            block = array('Q')
+            block.frombytes(f.read(buffer_size * 8))
+            if not block:
+                break
+            yield from block
+
+def unique_ids(runs):
+    '''
+    Merge sorted runs skipping duplicates.
+    '''
+    previous = None
+    for i in merge(*[read_run(run) for run in runs]):
+        if i != previous:
+            yield i
+            previous = i
+
+def iter_chunks(iterable, chunksize=100):
+    '''
+    Split an iterable in lists of N items.
+    '''
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, chunksize))
+        if not chunk:
+            break
+        yield chunk
@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+'''
+JSON encoding and decoding using the fastest library
+installed (orjson, ujson), falling back to stdlib json.
+
+Both dumps() and loads() work with strings, while
+loads() also accepts bytes as read from files.
+'''
+
+import json
+
+try:
+    import orjson
+    BACKEND = 'orjson'
+except ImportError:
+    try:
+        import ujson
+        BACKEND = 'ujson'
+    except ImportError:
+        BACKEND = 'json'
+
+def dumps(obj, sort_keys=False):
+    '''
+    Serialize object to a JSON formatted string.
+    '''
+    if BACKEND == 'orjson':
+        return orjson.dumps(obj, option=orjson.OPT_SORT_KEYS if sort_keys else 0).decode('utf8')
+    if BACKEND == 'ujson':
+        return ujson.dumps(obj, sort_keys=sort_keys, ensure_ascii=False, escape_forward_slashes=False)
+    return json.dumps(obj, sort_keys=sort_keys)
+
+def loads(data):
+    '''
+    Deserialize JSON string or bytes to object,
+    ignoring invalid UTF-8 characters in bytes.
+    '''
+    try:
+        if BACKEND == 'orjson':
+            return orjson.loads(data)
+        if BACKEND == 'ujson':
+            return ujson.loads(data)
+        return json.loads(data)
+    except ValueError:
+        if isinstance(data, bytes):
+            return json.loads(data.decode('utf8', 'ignore'))
+        raise
+
+def dump_line(obj, f, sort_keys=False):
+    '''
+    Write object to a JSON lines file and return
+    the string written, so it can be reused.
+    '''
+    data = dumps(obj, sort_keys=sort_keys)
+    f.write(data + '\n')
+    return data
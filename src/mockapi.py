@@ -0,0 +1,290 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+'''
+Local stand-in for the Twitter API endpoints used by
+collect.py, crawl.py, hydrate.py, stream.py and trends.py,
+with configurable latency, rate limits and errors, for
+benchmarks and tests without credentials:
+
+    os.environ['OAUTHLIB_INSECURE_TRANSPORT'] = '1'
+    server = MockTwitter(latency=0.05, errors={503: 0.01})
+    server.start()
+    api.API_URL = server.url + '%s'
+    stream.STREAM_URL = server.url
+
+Data is generated from IDs (see synth.py), so the same
+request returns the same tweets. Each search query or
+timeline has volume tweets, every 7th tweet ID is missing
+on lookups and users have followers by their ID.
+
+Tweets posted to any other path (e.g. by a PostSink to
+server.url + 'post') are counted as received.
+'''
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from random import Random
+from threading import Lock, Thread
+from time import sleep, time
+from urllib.parse import parse_qs, urlparse
+from zlib import crc32
+
+from api import RESOURCES
+from jsonlib import dumps, loads
+from synth import make_tweet, make_user, snowflake
+
+# endpoint path to query type (for rate limits)
+ENDPOINTS = {
+    'search/tweets': 'tweets',
+    'statuses/user_timeline': 'timeline',
+    'statuses/lookup': 'ids',
+    'statuses/show': 'id',
+    'statuses/retweets': 'retweets',
+    'statuses/retweeters/ids': 'retweeters',
+    'users/lookup': 'users',
+    'users/show': 'user',
+    'friends/ids': 'friends',
+    'followers/ids': 'followers',
+    'trends/place': 'trends'}
+
+class MockTwitter():
+    '''
+    Threaded HTTP server on localhost, with counters
+    of requests, errors, streamed and posted tweets.
+    '''
+    def __init__(self, port=0, latency=0, limits=None, window=900, errors=None,
+        volume=1000, stream_rate=1000, seed=0):
+        self.latency = latency  # seconds per request
+        self.limits = limits or {k: v[2] for k, v in RESOURCES.items()}
+        self.window = window
+        self.errors = errors or {} # probability by status code
+        self.volume = volume    # tweets per search or timeline
+        self.stream_rate = stream_rate # tweets per second
+        self.random = Random(seed)
+        self.budgets = {}       # [remaining, reset] by (token, query type)
+        self.counts = {'requests': 0, 'errors': 0, 'limited': 0, 'streamed': 0, 'posted': 0}
+        self.lock = Lock()
+        self.now = int(time())
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', port), handler(self))
+        self.server.daemon_threads = True
+        self.url = 'http://127.0.0.1:' + str(self.server.server_address[1]) + '/'
+
+    def start(self):
+        Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def count(self, key, n=1):
+        with self.lock:
+            self.counts[key] += n
+
+    def rate_limit(self, token, query_type):
+        '''
+        Return (limit, remaining, reset) after
+        spending a request of token, or None.
+        '''
+        now = time()
+        limit = self.limits.get(query_type)
+        if not limit:
+            return None
+        with self.lock:
+            budget = self.budgets.get((token, query_type))
+            if not budget or budget[1] <= now:
+                budget = self.budgets[(token, query_type)] = [limit, int(now + self.window)]
+            budget[0] -= 1
+            return limit, budget[0], budget[1]
+
+    def error(self):
+        '''
+        Return a random error status code, if any.
+        '''
+        with self.lock:
+            for code, p in self.errors.items():
+                if self.random.random() < p:
+                    return int(code)
+
+    def search(self, key, count=100, max_id=None, since_id=None):
+        '''
+        Return newest tweets of a query or user
+        within max_id and since_id, as on search.
+        '''
+        seed = crc32(str(key).lower().encode('utf8'))
+        top = snowflake(self.now) + seed % 4096
+        step = snowflake(60) - snowflake(0) # a tweet a minute
+        ids = []
+        for n in range(self.volume):
+            i = top - n * step
+            if (max_id and i > max_id):
+                continue
+            if (since_id and i <= since_id) or len(ids) >= count:
+                break
+            ids.append(i)
+        return [make_tweet(i, text=str(key) + ' ' + str(i % 1000)) for i in ids]
+
+    def lookup(self, ids):
+        return [make_tweet(i) for i in ids if i % 7]
+
+    def users(self, names=None, ids=None):
+        if ids:
+            return [make_user(i) for i in ids]
+        return [make_user(crc32(n.lower().encode('utf8')), n) for n in names]
+
+    def cursor_ids(self, user_id, cursor=-1, count=5000):
+        '''
+        Return page of follower/friend IDs of user.
+        '''
+        total = make_user(user_id)['followers_count']
+        start = 0 if cursor in (-1, 0) else cursor
+        ids = [crc32(str(user_id * 31 + n).encode('utf8')) % 10**6 + 1 for n in range(start, min(start + count, total))]
+        next_cursor = start + count if start + count < total else 0
+        return {'ids': ids, 'next_cursor': next_cursor, 'previous_cursor': 0}
+
+    def trends(self, woeid):
+        r = Random(woeid)
+        trends = [{'name': '#' + w, 'tweet_volume': r.choice([None, r.randint(10000, 500000)])}
+                  for w in r.sample(sorted(set(make_tweet(woeid)['full_text'].split())), 3)]
+        return [{'trends': trends, 'locations': [{'name': 'Mock ' + str(woeid), 'woeid': woeid}]}]
+
+def handler(mock):
+    '''
+    Return request handler class bound to server.
+    '''
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+        disable_nagle_algorithm = True # no delayed body after headers
+
+        def log_message(self, *args):
+            pass
+
+        def send_json(self, data, status=200, headers={}):
+            body = dumps(data).encode('utf8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            for k, v in headers.items():
+                self.send_header(k, str(v))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def read_body(self):
+            length = int(self.headers.get('Content-Length') or 0)
+            return self.rfile.read(length) if length else b''
+
+        def params(self, body=b''):
+            url = urlparse(self.path)
+            params = parse_qs(url.query)
+            if body and 'json' not in str(self.headers.get('Content-Type')):
+                params.update(parse_qs(body.decode('utf8')))
+            return url.path.strip('/'), {k: v[-1] for k, v in params.items()}
+
+        def do_GET(self):
+            self.route(*self.params())
+
+        def do_POST(self):
+            body = self.read_body()
+            path, params = self.params(body)
+            if path == 'oauth2/token':
+                return self.send_json({'token_type': 'bearer', 'access_token': 'mock' + str(crc32(body))})
+            if path.endswith('statuses/filter.json') or path.endswith('statuses/sample.json'):
+                return self.stream(params)
+            if not path.startswith('1.1/'): # receiver
+                mock.count('posted', len(loads(body)) if body else 0)
+                return self.send_json({'ok': True})
+            self.route(path, params)
+
+        def route(self, path, params):
+            mock.count('requests')
+            sleep(mock.latency) if mock.latency else None
+
+            if path.endswith('statuses/sample.json'):
+                return self.stream(params)
+
+            endpoint = path[4:-5] if path.startswith('1.1/') else path # e.g. "search/tweets"
+            parts = endpoint.split('/')
+            query_type = ENDPOINTS.get(endpoint) or ENDPOINTS.get('/'.join(parts[:2]))
+            token = self.headers.get('Authorization', '')
+            headers = {}
+
+            if endpoint == 'application/rate_limit_status':
+                return self.send_json({'resources': {v[0]: {v[1]: {'limit': mock.limits.get(k), 'remaining':
+                                      mock.limits.get(k), 'reset': int(time() + mock.window)}}
+                                      for k, v in RESOURCES.items()}})
+
+            if not query_type:
+                return self.send_json({'errors': [{'code': 34, 'message': 'Not found'}]}, 404)
+
+            budget = mock.rate_limit(token, query_type)
+            if budget:
+                headers = {'x-rate-limit-limit': budget[0], 'x-rate-limit-remaining': max(budget[1], 0),
+                           'x-rate-limit-reset': budget[2]}
+                if budget[1] < 0:
+                    mock.count('limited')
+                    return self.send_json({'errors': [{'code': 88, 'message': 'Rate limit exceeded'}]}, 429, headers)
+
+            code = mock.error()
+            if code:
+                mock.count('errors')
+                return self.send_json({'errors': [{'code': 0, 'message': 'Mock error'}]}, code, headers)
+
+            count = int(params.get('count', 100))
+            max_id = int(params['max_id']) if params.get('max_id') else None
+            since_id = int(params['since_id']) if params.get('since_id') else None
+            user = params.get('screen_name') or params.get('user_id') or params.get('id')
+
+            if query_type in ('tweets', 'timeline'):
+                statuses = mock.search(params.get('q') or user, count, max_id, since_id)
+                data = {'statuses': statuses, 'search_metadata': {}} if query_type == 'tweets' else statuses
+            elif query_type == 'ids':
+                data = mock.lookup(int(i) for i in params.get('id', '').split(',') if i)
+            elif query_type == 'id':
+                data = make_tweet(int(parts[-1]))
+            elif query_type == 'retweets':
+                data = [dict(make_tweet(int(parts[-1]) + n), retweeted_status=make_tweet(int(parts[-1])))
+                        for n in range(1, 1 + min(count, 20))]
+            elif query_type in ('users', 'user'):
+                names, ids = params.get('screen_name'), params.get('user_id')
+                data = mock.users(names.split(',') if names else None, [int(i) for i in ids.split(',')] if ids else None)
+                data = data[0] if query_type == 'user' else data
+            elif query_type in ('retweeters', 'friends', 'followers'):
+                data = mock.cursor_ids(int(user) if str(user).isdigit() else crc32(user.encode('utf8')),
+                                       int(params.get('cursor', -1)), min(count, 5000))
+            elif query_type == 'trends':
+                data = mock.trends(int(params.get('id', 1)))
+
+            self.send_json(data, 200, headers)
+
+        def stream(self, params):
+            '''
+            Send tweets as chunked JSON lines at
+            stream_rate until client disconnects.
+            '''
+            mock.count('requests')
+            track = (params.get('track') or 'sample').split(',')
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Transfer-Encoding', 'chunked')
+            self.end_headers()
+
+            i = snowflake(time())
+            start = time()
+            sent = 0
+            try:
+                while True:
+                    lines = []
+                    for n in range(max(1, mock.stream_rate // 100)):
+                        i += 1
+                        lines.append(dumps(make_tweet(i, text=track[i % len(track)] + ' ' + str(i % 1000), extended=False)) + '\r\n')
+                    data = ''.join(lines).encode('utf8')
+                    self.wfile.write(('%x\r\n' % len(data)).encode() + data + b'\r\n')
+                    self.wfile.flush()
+                    sent += len(lines)
+                    mock.count('streamed', len(lines))
+                    sleep(max(0, start + sent / mock.stream_rate - time()))
+            except (BrokenPipeError, ConnectionResetError):
+                pass
+
+    return Handler
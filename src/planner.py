@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+'''
+Pack search terms into OR-combined queries up to the
+length limit of the search endpoint, grouped by their
+"lang:" and "geocode:" operators (or the defaults), so
+low-volume terms share requests instead of one each:
+
+    >>> pack_queries(['cpc', 'ufes', '"ciência política" lang:pt'])
+    [('cpc OR ufes', None, None, ['cpc', 'ufes']),
+     ('"ciência política"', 'pt', None, ['"ciência política"'])]
+
+Only single words, hashtags, mentions and quoted phrases
+are packed, other terms (e.g. with "-" or "from:") are
+searched on their own. Returned tweets are attributed to
+the terms they match with match_terms().
+'''
+
+import re
+
+from functools import lru_cache
+
+MAX_LENGTH = 500 # search query limit including operators
+
+def pack_queries(terms, max_length=MAX_LENGTH, lang=None, geocode=None):
+    '''
+    Return list of (query, lang, geocode, terms) with
+    packed terms in input order within each group.
+    '''
+    groups = {} # packable terms by (lang, geocode)
+    queries = []
+
+    for term in terms:
+        core, term_lang, term_geocode = parse_term(term)
+        key = (term_lang or lang, term_geocode or geocode)
+        if is_packable(core) and len(core) <= max_length:
+            groups.setdefault(key, []).append(core)
+        else: queries.append((core, key[0], key[1], [core]))
+
+    for (group_lang, group_geocode), group in groups.items():
+        packed = []
+        for core in group:
+            if packed and len(' OR '.join(packed + [core])) > max_length:
+                queries.append((' OR '.join(packed), group_lang, group_geocode, packed))
+                packed = []
+            packed.append(core)
+        queries.append((' OR '.join(packed), group_lang, group_geocode, packed))
+
+    return queries
+
+def parse_term(term):
+    '''
+    Split "lang:" and "geocode:" operators from term.
+    '''
+    lang = None
+    geocode = None
+    words = []
+
+    for word in term.split():
+        if word.startswith('lang:'):
+            lang = word[5:]
+        elif word.startswith('geocode:'):
+            geocode = word[8:]
+        else: words.append(word)
+
+    return ' '.join(words), lang, geocode
+
+def is_packable(core):
+    '''
+    Check if term is a single word or quoted phrase.
+    '''
+    if len(core) > 2 and core.startswith('"') and core.endswith('"'):
+        return '"' not in core[1:-1]
+    return bool(core) and ' ' not in core and ':' not in core\
+           and core[0] not in '-+(' and core != 'OR'
+
+@lru_cache(maxsize=None)
+def term_pattern(term):
+    phrase = term.strip('"').lower()
+    return re.compile(r'(?<!\w)' + re.escape(phrase) + r'(?!\w)')
+
+def match_terms(status, terms, separator='|'):
+    '''
+    Return terms found on tweet text, retweeted or quoted
+    text, URLs or author, or all terms if none is found.
+    '''
+    text = []
+
+    for tweet in (status, status.get('retweeted_status'), status.get('quoted_status')):
+        if tweet:
+            text.append(tweet['full_text'] if 'full_text' in tweet else tweet.get('text', ''))
+            text.append('@' + tweet['user']['screen_name'])
+            text.extend(u.get('expanded_url') or '' for u in tweet.get('entities', {}).get('urls', []))
+
+    text = ' '.join(text).lower()
+    found = [t for t in terms if term_pattern(t).search(text)]
+    return separator.join(found or terms)
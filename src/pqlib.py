@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+'''
+Functions for handling Apache Parquet columnar files,
+with typed schemas derived from tweet and user headers.
+'''
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from datetime import datetime
+
+from convert import HEADER_TWEETS, HEADER_USERS, parse_created_at
+
+COORDINATES = pa.list_(pa.float64())
+BOUNDING_BOX = pa.list_(pa.list_(pa.list_(pa.float64())))
+TIMESTAMP = pa.timestamp('ms')
+
+TYPES_TWEETS = {'retweet_count': pa.int64(), 'favorite_count': pa.int64(), 'followers_count': pa.int64(),
+    'original_tweet_created_at': TIMESTAMP, 'retweet_created_at': TIMESTAMP, 'quoted_created_at': TIMESTAMP,
+    'original_tweet_coordinates': COORDINATES, 'retweet_coordinates': COORDINATES, 'quoted_coordinates': COORDINATES,
+    'is_retweet': pa.bool_(), 'timestamp': pa.int64(), 'place_bb': BOUNDING_BOX}
+
+TYPES_USERS = {'statuses_count': pa.int64(), 'followers_count': pa.int64(), 'friends_count': pa.int64(),
+    'listed_count': pa.int64(), 'favourites_count': pa.int64(), 'created_at': TIMESTAMP,
+    'protected': pa.bool_(), 'default_profile': pa.bool_(), 'default_profile_image': pa.bool_(),
+    'verified': pa.bool_()}
+
+class ParquetRowWriter():
+    '''
+    Write rows as returned by load_tweet_object() or
+    load_user_object() to a Parquet file, buffering them
+    in memory and flushing a row group every N rows.
+    '''
+    def __init__(self, output_file, header=HEADER_TWEETS, row_group_size=50000, compression='snappy'):
+        self.header = list(header)
+        self.schema = parquet_schema(self.header)
+        self.row_group_size = row_group_size
+        self.columns = [[] for c in self.header]
+        self.rows = 0
+        self.writer = pq.ParquetWriter(output_file, self.schema, compression=compression)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def writerow(self, row):
+        for column, value in zip(self.columns, row):
+            column.append(value)
+        self.rows += 1
+        if self.rows >= self.row_group_size:
+            self.flush()
+
+    def writerows(self, rows):
+        for row in rows:
+            self.writerow(row)
+
+    def write_table(self, table):
+        self.flush()
+        self.writer.write_table(table.cast(self.schema))
+
+    def flush(self):
+        if self.rows:
+            arrays = [to_arrow(column, dtype) for dtype, column in zip(self.schema.types, self.columns)]
+            self.writer.write_table(pa.Table.from_arrays(arrays, schema=self.schema))
+            self.columns = [[] for c in self.header]
+            self.rows = 0
+
+    def close(self):
+        self.flush()
+        self.writer.close()
+
+def parquet_schema(header=HEADER_TWEETS):
+    '''
+    Return typed schema for the fields in header,
+    defaulting to string for identifiers and text.
+    '''
+    types = TYPES_USERS if set(header) <= set(HEADER_USERS) else TYPES_TWEETS
+    return pa.schema([pa.field(name, types.get(name, pa.string())) for name in header])
+
+def to_arrow(values, dtype):
+    '''
+    Convert a column of values from CSV rows
+    to an array of its schema type.
+    '''
+    if dtype == pa.bool_():
+        values = [bool(v) for v in values] # <-- e.g. 'True' or ''
+
+    elif dtype == TIMESTAMP:
+        values = [to_datetime(v) if v else None for v in values]
+
+    elif dtype == COORDINATES:
+        values = [None if v is None or v == '' else v['coordinates'] if isinstance(v, dict) else v for v in values]
+
+    elif dtype == pa.string():
+        values = [None if v is None or v == '' else str(v) for v in values]
+
+    else: values = [None if v == '' else v for v in values]
+
+    return pa.array(values, type=dtype)
+
+def to_datetime(value):
+    '''
+    Return datetime from a "YYYY-MM-DD HH:MM:SS" string
+    or a "created_at" field, without strptime().
+    '''
+    if value[3:4] == ' ': # e.g. "Mon Oct 01 12:00:05 +0000 2019"
+        value = parse_created_at(value)[0]
+    return datetime.fromisoformat(value)
+
+def merge_parquet(input_files, output_file, header=HEADER_TWEETS):
+    '''
+    Concatenate Parquet files in order, one row group at a time.
+    '''
+    with ParquetRowWriter(output_file, header) as file_writer:
+        for f in input_files:
+            parquet_file = pq.ParquetFile(f)
+            for i in range(parquet_file.num_row_groups):
+                file_writer.write_table(parquet_file.read_row_group(i))
+    return output_file
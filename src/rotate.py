@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+'''
+Write streamed data to segment files rotated by size,
+elapsed time or date partitions such as "%Y/%m/%d/%H".
+
+Unfinished segments end in ".part" and are renamed when
+closed, then listed on a manifest file as JSON lines,
+so jobs can pick up finished segments incrementally:
+
+    for f in read_manifest('output')[0]:
+        convert_json_tweets(f)
+'''
+
+from os import fsync, makedirs, replace
+from os.path import exists, join, relpath
+from time import gmtime, strftime, time
+
+from jsonlib import dumps, loads
+from ziplib import SUFFIXES, get_compression, open_file
+
+MANIFEST = 'manifest.json'
+
+class RotatingFile():
+    '''
+    Binary file object writing to rotating segments,
+    checked on every write so lines are never split.
+    '''
+    def __init__(self, output='.', name='tweets.json', max_bytes=None,
+        max_seconds=None, layout=None, compression=None):
+        self.output = output
+        self.name = name
+        self.max_bytes = max_bytes
+        self.max_seconds = max_seconds
+        self.layout = layout
+        self.compression = get_compression(name, compression)
+        self.fileobj = None
+        self.segments = 0
+
+    def open(self):
+        now = time()
+        self.partition = strftime(self.layout, gmtime(now)) if self.layout else ''
+        path = join(self.output, self.partition)
+
+        if not exists(path):
+            makedirs(path)
+
+        name, ext = (self.name.split('.', 1) + [''])[:2]
+        ext = '.' + ext if ext else ''
+        suffix = SUFFIXES.get(self.compression, '')
+        ext += suffix if not ext.endswith(suffix) else ''
+
+        self.segments += 1
+        stamp = strftime('%Y%m%d_%H%M%S', gmtime(now)) + '_' + str(self.segments).zfill(6)
+        self.filename = join(path, name + '_' + stamp + ext)
+        self.fileobj = open_file(self.filename + '.part', 'ab', self.compression)
+        self.opened = now
+        self.bytes = 0
+        self.lines = 0
+
+    def write(self, data):
+        if self.fileobj and self.should_rotate():
+            self.rotate()
+        if not self.fileobj:
+            self.open()
+        self.fileobj.write(data)
+        self.bytes += len(data)
+        self.lines += data.count(b'\n')
+        return len(data)
+
+    def check(self):
+        '''
+        Close current segment if due, called
+        periodically when there is no data.
+        '''
+        if self.fileobj and self.should_rotate():
+            self.rotate()
+
+    def should_rotate(self):
+        now = time()
+        if self.max_bytes and self.bytes >= self.max_bytes:
+            return True
+        if self.max_seconds and now - self.opened >= self.max_seconds:
+            return True
+        if self.layout and strftime(self.layout, gmtime(now)) != self.partition:
+            return True
+        return False
+
+    def rotate(self):
+        '''
+        Close current segment, rename it to
+        its final name and add to manifest.
+        '''
+        self.fileobj.close()
+        self.fileobj = None
+        replace(self.filename + '.part', self.filename)
+
+        with open(join(self.output, MANIFEST), 'a', encoding='utf8') as f:
+            f.write(dumps({'file': relpath(self.filename, self.output),
+                           'bytes': self.bytes,
+                           'lines': self.lines,
+                           'opened': int(self.opened),
+                           'closed': int(time())}) + '\n')
+            f.flush()
+            fsync(f.fileno())
+
+    def close(self):
+        if self.fileobj:
+            self.rotate()
+
+def read_manifest(output='.', start=0):
+    '''
+    Return paths of finished segments listed on
+    manifest from line number start onwards, and
+    the line number to start from on a next call.
+    '''
+    files = []
+    count = 0
+    manifest = join(output, MANIFEST)
+
+    if exists(manifest):
+        with open(manifest, 'rb') as f:
+            for line in f:
+                if count >= start and line.endswith(b'\n'):
+                    files.append(join(output, loads(line)['file']))
+                count += 1
+
+    return files, start + len(files)
@@ -0,0 +1,192 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+'''
+Write tweets or users to MySQL or SQLite databases in
+batches, as rows from load_tweet_object() and
+load_user_object() mapped to table columns.
+
+Rows are upserted on the tweet or user ID, so writing
+the same data twice (e.g. when resuming) is harmless:
+
+    db = DatabaseSink('tweets.db') # SQLite
+    db = DatabaseSink('cpc', host='localhost', user='me', password='pwd')
+
+User profiles seen in tweets or lookups can be kept on
+a UserCache, so those fetched within ttl seconds are
+not requested again:
+
+    cache = UserCache('users.db', ttl=86400)
+'''
+
+import sqlite3
+
+from threading import Lock
+from time import time
+
+from api import connect_mysql
+from convert import HEADER_TWEETS, HEADER_USERS, load_tweet_object, load_user_object, parse_created_at
+from jsonlib import dumps, loads
+
+SQL_TYPES = {'retweet_count': 'BIGINT', 'favorite_count': 'BIGINT', 'followers_count': 'BIGINT',
+    'statuses_count': 'BIGINT', 'friends_count': 'BIGINT', 'listed_count': 'BIGINT',
+    'favourites_count': 'BIGINT', 'timestamp': 'BIGINT', 'is_retweet': 'BOOLEAN',
+    'protected': 'BOOLEAN', 'default_profile': 'BOOLEAN', 'default_profile_image': 'BOOLEAN',
+    'verified': 'BOOLEAN', 'original_tweet_created_at': 'DATETIME', 'retweet_created_at': 'DATETIME',
+    'quoted_created_at': 'DATETIME', 'created_at': 'DATETIME'}
+
+class DatabaseSink():
+    '''
+    Insert rows in batches of commit_size using executemany()
+    on a MySQL (if host is set, pooled) or SQLite connection.
+    '''
+    def __init__(self, database, table=None, header=HEADER_TWEETS, host=None,
+        user=None, password=None, commit_size=1000, pool_size=2):
+
+        self.header = list(header)
+        self.is_users = set(self.header) <= set(HEADER_USERS)
+        self.key = 'id_str' if self.is_users else 'original_tweet_id'
+        self.table = table or ('users' if self.is_users else 'tweets')
+        self.commit_size = commit_size
+        self.rows = []
+        self.written = 0
+
+        if self.key not in self.header:
+            raise ValueError('header must include "' + self.key + '" to upsert rows.')
+
+        if host: # MySQL
+            self.db = connect_mysql(host, database, user, password, pool_size=pool_size)
+            self.placeholder = '%s'
+        else: # SQLite
+            self.db = sqlite3.connect(database, check_same_thread=False)
+            self.placeholder = '?'
+
+        self.create_table()
+        self.query = self.upsert_query()
+
+    def create_table(self):
+        columns = []
+        for c in self.header:
+            sql_type = SQL_TYPES.get(c, 'VARCHAR(32)' if c == self.key else 'TEXT')
+            columns.append(c + ' ' + sql_type + (' PRIMARY KEY' if c == self.key else ''))
+        cursor = self.db.cursor()
+        cursor.execute('CREATE TABLE IF NOT EXISTS ' + self.table + ' (' + ', '.join(columns) + ')')
+        self.db.commit()
+        cursor.close()
+
+    def upsert_query(self):
+        columns = ', '.join(self.header)
+        values = ', '.join([self.placeholder] * len(self.header))
+
+        if self.placeholder == '?':
+            return 'INSERT OR REPLACE INTO ' + self.table + ' (' + columns + ') VALUES (' + values + ')'
+
+        updates = ', '.join(c + '=VALUES(' + c + ')' for c in self.header if c != self.key)
+        return 'INSERT INTO ' + self.table + ' (' + columns + ') VALUES (' + values + ')'\
+               ' ON DUPLICATE KEY UPDATE ' + updates
+
+    def writerow(self, row):
+        self.rows.append([to_sql(c, v) for c, v in zip(self.header, row)])
+        if len(self.rows) >= self.commit_size:
+            self.commit()
+
+    def writerows(self, rows):
+        for row in rows:
+            self.writerow(row)
+
+    def write_status(self, status, search_string=''):
+        '''
+        Load tweet or user object and write row.
+        '''
+        if self.is_users:
+            self.writerow(load_user_object(status, columns=self.header))
+        else: self.writerow(load_tweet_object(status, search_string, columns=self.header))
+
+    def commit(self):
+        if self.rows:
+            cursor = self.db.cursor()
+            cursor.executemany(self.query, self.rows)
+            self.db.commit()
+            cursor.close()
+            self.written += len(self.rows)
+            self.rows = []
+
+    def close(self):
+        self.commit()
+        self.db.close()
+
+class UserCache():
+    '''
+    Latest user object by "id_str" (and screen name)
+    on a SQLite table, with the time it was seen.
+    '''
+    def __init__(self, database=':memory:', ttl=86400, table='user_cache', commit_size=1000):
+        self.ttl = ttl
+        self.table = table
+        self.commit_size = commit_size
+        self.pending = 0
+        self.lock = Lock()
+        self.db = sqlite3.connect(database, check_same_thread=False)
+        self.db.execute('CREATE TABLE IF NOT EXISTS ' + table + ' (id_str VARCHAR(32) PRIMARY KEY,'
+                        ' screen_name TEXT, updated BIGINT, user TEXT)')
+        self.db.execute('CREATE INDEX IF NOT EXISTS ' + table + '_screen_name ON ' + table + ' (screen_name)')
+        self.db.commit()
+
+    def get(self, key, is_user_id=False):
+        '''
+        Return user by ID or screen name if fresh.
+        '''
+        column = 'id_str' if is_user_id else 'screen_name'
+        with self.lock:
+            row = self.db.execute('SELECT user FROM ' + self.table + ' WHERE ' + column + '=? AND updated>=?',
+                                  (str(key).lower().lstrip('@'), time() - self.ttl)).fetchone()
+        return loads(row[0]) if row else None
+
+    def split(self, keys, is_user_id=False):
+        '''
+        Return fresh users found and keys missing.
+        '''
+        found, missing = [], []
+        for key in keys:
+            user = self.get(key, is_user_id)
+            found.append(user) if user else missing.append(key)
+        return found, missing
+
+    def put(self, users, updated=None):
+        rows = [(u['id_str'], u['screen_name'].lower(), updated or int(time()), dumps(u)) for u in users]
+        with self.lock:
+            self.db.executemany('INSERT OR REPLACE INTO ' + self.table + ' VALUES (?, ?, ?, ?)', rows)
+            self.pending += len(rows)
+            if self.pending >= self.commit_size:
+                self.commit()
+
+    def put_tweet(self, status):
+        '''
+        Store authors of tweet, retweeted and quoted tweet.
+        '''
+        tweets = [status, status.get('retweeted_status'), status.get('quoted_status')]
+        self.put([t['user'] for t in tweets if t and 'user' in t])
+
+    def commit(self):
+        self.db.commit()
+        self.pending = 0
+
+    def close(self):
+        with self.lock:
+            self.commit()
+            self.db.close()
+
+def to_sql(column, value):
+    '''
+    Convert a value from a CSV row to SQL.
+    '''
+    if isinstance(value, (dict, list)):
+        return dumps(value)
+
+    if SQL_TYPES.get(column) == 'BOOLEAN':
+        return bool(value)
+
+    if column == 'created_at' and value: # e.g. "Mon Oct 01 12:00:05 +0000 2019"
+        return parse_created_at(value)[0]
+
+    return value
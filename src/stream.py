@@ -13,20 +13,52 @@ More information on query operators can be read at:
 
 Documentation on the sample of flowing tweets:
     https://dev.twitter.com/en/docs/tweets/sample-realtime/api-reference/get-statuses-sample
+
+Set passthrough=True to archive the raw bytes of each
+message as received, skipping parsing and re-serializing
+while still applying the @-message/retweet filters.
+
+Messages are read on the network thread and put in a
+bounded queue, drained by a writer thread keeping the
+output file open and by a PostSink sending batches,
+so slow disks or endpoints don't stall the connection.
+All state is kept per stream, allowing several streams
+to run in the same process from different threads.
+Tweets are also upserted to a MySQL or SQLite database
+if set as a DatabaseSink object (see sqllib.py).
+
+Set max_bytes, max_seconds or a layout of partitions
+such as "%Y/%m/%d/%H" to rotate output files, listing
+finished segments on "manifest.json" (see rotate.py).
+
+Use stream_sharded() to split keywords across all tokens
+in TWITTER_TOKENS, one connection per token, merging
+them to a single output without duplicate tweets.
 """
 
-import json
+import re
 
 from os import makedirs
 from os.path import abspath, exists
-from requests import post
-from time import time
+from collections import deque
+from queue import Empty, Queue
+from requests.exceptions import Timeout
+from sys import stderr
+from threading import Event, Thread
+from time import sleep
 from twython import TwythonStreamer
+from twython.helpers import _transparent_params
 
-from api import post_tweets
+from api import PostSink
+from jsonlib import dumps, loads
+from rotate import RotatingFile
+from ziplib import SUFFIXES, open_file
 
 try: # user credentials
     from config import TWITTER_TOKENS
+except: TWITTER_TOKENS = []
+
+try: # first credentials
     APP_KEY = TWITTER_TOKENS[0][0]
     APP_SECRET = TWITTER_TOKENS[0][1]
     OAUTH_TOKEN = TWITTER_TOKENS[0][2]
@@ -45,94 +77,281 @@ try: # capture retweets
     from config import STREAM_RTS
 except: STREAM_RTS = True
 
+try: # e.g. a local mock server (see mockapi.py)
+    from config import STREAM_URL
+except: STREAM_URL = None
+
+# markers on raw messages, compact or not (first match
+# is top-level, as it comes before nested statuses)
+RE_ID = re.compile(rb'"id_str":\s*"(\d+)"')
+RE_REPLY = re.compile(rb'"in_reply_to_status_id":\s*(null)?')
+RE_RETWEET = re.compile(rb'"retweeted_status":\s*\{')
+
 class Stream(TwythonStreamer):
     '''
     Execute action on every streamed tweet.
     '''
+    def __init__(self, app_key, app_secret, oauth_token, oauth_secret,
+        output=None, post_url=None, limit=None, interval=10, quiet=False,
+        ats=STREAM_ATS, rts=STREAM_RTS, passthrough=False, compression=None,
+        queue_size=10000, batch_size=1000, database=None, writer=None, chunk_size=65536,
+        spill_dir='spill', **kwargs):
+
+        # read as much as received up to chunk_size bytes
+        # (Twython's default of 1 byte caps throughput)
+        super().__init__(app_key, app_secret, oauth_token, oauth_secret, chunk_size=chunk_size, **kwargs)
+
+        self.captured = 0         # captured tweets counter
+        self.total_ats = 0        # captured @-messages counter
+        self.total_rts = 0        # captured retweets counter
+        self.backoff = 0          # seconds to wait on errors
+        self.limit = limit        # maximum number of tweets to capture
+        self.ats = ats            # True to capture @-messages
+        self.rts = rts            # True to capture retweets
+        self.passthrough = passthrough # True to write raw bytes
+
+        # shared writer or own one
+        self.own_writer = writer is None
+        self.writer = writer or StreamWriter(output=output,
+                                             post_url=post_url,
+                                             interval=interval,
+                                             quiet=quiet,
+                                             passthrough=passthrough,
+                                             compression=compression,
+                                             queue_size=queue_size,
+                                             batch_size=batch_size,
+                                             database=database,
+                                             spill_dir=spill_dir)
+        self.writer.streams.append(self)
+
     def on_success(self, data):
+        self.backoff = 0
         if 'text' in data:
-            load_tweet(data)
-
-    def on_error(self, status_code, data):
+            is_at = True if data['in_reply_to_status_id'] else False # tweet_text.startswith('@')
+            is_rt = True if 'retweeted_status' in data else False # tweet_text.startswith('RT @')
+            self.load_tweet(data, is_at, is_rt)
+
+    def on_raw(self, line):
+        self.backoff = 0
+        if b'"text":' in line:
+            reply = RE_REPLY.search(line)
+            is_at = bool(reply) and not reply.group(1)
+            is_rt = bool(RE_RETWEET.search(line))
+            self.load_tweet(line, is_at, is_rt)
+
+    def on_error(self, status_code, data, headers=None):
         print(status_code, data)
+        # exponential backoff before reconnecting, starting
+        # from a minute if rate limited (420/429) or 5 seconds
+        self.backoff = min(self.backoff*2, 320) if self.backoff\
+                       else (60 if status_code in (420, 429) else 5)
+        sleep(self.backoff) if self.connected else None
         return True # don't quit streaming
         # self.disconnect() # quit streaming
 
     def on_timeout(self):
-        print >> sys.stderr, 'Timeout...'
+        print('Timeout...', file=stderr)
+        # linear backoff on network errors up to 16 seconds
+        self.backoff = min(self.backoff + 0.25, 16)
+        sleep(self.backoff) if self.connected else None
         return True # don't quit streaming
 
-def stream_tweets(query="",
-    stream_type='filter',
-    app_key=APP_KEY,
-    app_secret=APP_SECRET,
-    oauth_token=OAUTH_TOKEN,
-    oauth_secret=OAUTH_SECRET,
-    ats=STREAM_ATS,
-    rts=STREAM_RTS,
-    limit=None,
-    interval=10,
-    output='.',
-    post_url=None,
-    quiet=False):
+    def _request(self, url, method='GET', params=None):
+        '''
+        Read lines as raw bytes if in passthrough mode.
+        '''
+        if STREAM_URL: # e.g. "http://127.0.0.1:8000/"
+            url = url.replace('https://stream.twitter.com/', STREAM_URL)
 
-    global TWEETS, CAPTURED, LIMIT, OUTPUT, POST_URL
-    global INTERVAL, QUIET, TOTAL_ATS, TOTAL_RTS
-    global stream
+        if not self.passthrough:
+            return super()._request(url, method=method, params=params)
 
-    if not exists(output):
-        makedirs(output)
+        self.connected = True
+        params, _ = _transparent_params(params)
+        requests_args = {k: v for k, v in self.client_args.items()
+                         if k in ('timeout', 'allow_redirects', 'verify')}
+        requests_args['params' if method == 'GET' else 'data'] = params
 
-    output = abspath(output+'/tweets.json')
+        while self.connected:
+            try: response = self.client.request(method, url, stream=True, **requests_args)
+            except Timeout:
+                self.on_timeout()
+                continue
 
-    TWEETS = []         # array of tweets to send
-    CAPTURED = 0        # captured tweets counter
-    TOTAL_ATS = 0       # captured @-messages counter
-    TOTAL_RTS = 0       # captured retweets counter
-    LIMIT = limit       # maximum number of tweets to capture
-    OUTPUT = output     # output file name to write tweets
-    POST_URL = post_url # endpoint URL to send tweets to
-    INTERVAL = interval # number of tweets to send at once
-    QUIET = quiet       # True for less verbose output
+            if response.status_code != 200:
+                self.on_error(response.status_code, response.content)
+                continue
 
-    # requires authentication as of Twitter API v1.1
-    stream = Stream(app_key, app_secret, oauth_token, oauth_secret)
+            for line in response.iter_lines(self.chunk_size):
+                if not self.connected:
+                    break
+                if line:
+                    self.on_raw(line)
 
-    if (not query) or (stream_type == 'sample'):
-        stream.statuses.sample()
+            response.close()
+
+    def load_tweet(self, data, is_at, is_rt):
+        '''
+        Update counters and queue tweet (dictionary or
+        raw bytes) if its type is set to be captured.
+        '''
+        is_tweet = all(not i for i in [is_at, is_rt])
+        self.total_ats += 1 if is_at else 0
+        self.total_rts += 1 if is_rt else 0
 
-    elif stream_type == 'filter': # default
-        stream.statuses.filter(track=query)
+        if is_tweet or (is_at and self.ats) or (is_rt and self.rts):
+            self.captured += 1
+            self.writer.put(data) # <-- blocks if writer is behind
 
-    # stream.site(follow='twitter')
-    # stream.user()
+        if self.limit and self.captured >= self.limit:
+            self.disconnect()
 
-def load_tweet(data):
+    def close(self):
+        '''
+        Close writer if not shared with other streams.
+        '''
+        self.writer.close() if self.own_writer else None
+
+class StreamWriter():
     '''
-    Store tweet to array in JSON format.
+    Write and send tweets queued by one or more streams,
+    optionally skipping tweets already seen among the last
+    N tweets (dedupe) and stopping all streams on limit.
     '''
-    def send_tweets():
+    def __init__(self, output=None, post_url=None, interval=10, quiet=False,
+        passthrough=False, compression=None, queue_size=10000, batch_size=1000,
+        limit=None, dedupe=0, database=None, spill_dir='spill'):
+
+        self.streams = []         # streams writing to this object
+        self.written = 0          # written tweets counter
+        self.duplicates = 0       # skipped tweets counter
+        self.limit = limit        # maximum number of tweets to write
+        self.post_url = post_url  # endpoint URL to send tweets to
+        self.interval = interval  # number of tweets to send at once
+        self.quiet = quiet        # True for less verbose output
+        self.passthrough = passthrough # True to write raw bytes
+        self.batch_size = batch_size   # maximum tweets per write
+        self.dedupe = dedupe      # number of recent IDs to check
+        self.database = database  # database sink object
+        self.seen = set()
+        self.recent = deque()
+        self.error = None         # error raised on writer thread
+
+        # output file (name or object) to write tweets
+        if isinstance(output, str):
+            output = open_file(output, 'ab', compression)
+        self.output = output
+
+        self.queue = Queue(maxsize=queue_size)
+
+        self.writer = Thread(target=self.write_tweets, daemon=True)
+        self.writer.start()
+
+        # send arrays of interval size
+        self.sink = PostSink(post_url, batch_size=interval, queue_size=queue_size, spill_dir=spill_dir) if post_url else None
+
+    def put(self, data):
+        if self.error:
+            raise self.error
+        self.queue.put(data)
+
+    def is_duplicate(self, data):
         '''
-        Send tweets array to API endpoint.
+        Check tweet ID against the recent ones.
         '''
-        post_tweets(TWEETS, POST_URL)
+        if isinstance(data, bytes):
+            match = RE_ID.search(data) # <-- top-level ID
+            tweet_id = match.group(1).decode() if match else loads(data).get('id_str')
+        else: tweet_id = data.get('id_str')
+
+        if tweet_id in self.seen:
+            self.duplicates += 1
+            return True
+
+        self.seen.add(tweet_id)
+        self.recent.append(tweet_id)
+        if len(self.recent) > self.dedupe:
+            self.seen.discard(self.recent.popleft())
 
-    def flush_tweets():
+        return False
+
+    def write_tweets(self):
         '''
-        Reset tweets array after successful post.
+        Drain queue writing tweets in batches to output
+        file and forwarding them to the endpoint sink,
+        keeping errors to raise on put() or close().
         '''
-        global TWEETS
-        TWEETS = []
-
-    def write_tweet_json(data):
+        finished = False
+
+        while not finished:
+            try: batch = [self.queue.get(timeout=1)]
+            except Empty: # close due segments
+                if isinstance(self.output, RotatingFile) and not self.error:
+                    try: self.output.check()
+                    except Exception as e:
+                        self.fail(e)
+                continue
+
+            while len(batch) < self.batch_size:
+                try: batch.append(self.queue.get_nowait())
+                except Empty: break
+
+            if None in batch:
+                batch = batch[:batch.index(None)]
+                finished = True
+
+            if self.error: # keep draining
+                continue
+
+            try: self.write_batch(batch)
+            except Exception as e:
+                self.fail(e)
+
+    def write_batch(self, batch):
+        if self.dedupe:
+            batch = [data for data in batch if not self.is_duplicate(data)]
+
+        if self.limit:
+            batch = batch[:max(self.limit - self.written, 0)]
+
+        lines = []
+        for data in batch:
+            if isinstance(data, bytes):
+                lines.append(data)
+            else: # parsed tweet
+                lines.append(dumps(data, sort_keys=True).encode('utf8'))
+                self.print_tweet(data) if not self.quiet else None
+
+        if lines and self.output:
+            self.output.write(b'\n'.join(lines) + b'\n')
+
+        if self.sink:
+            for line in lines:
+                self.sink.put(line.decode('utf8', 'ignore'))
+
+        if self.database:
+            for data in batch:
+                self.database.write_status(loads(data) if isinstance(data, bytes) else data)
+
+        written = self.written + len(lines)
+        if (self.quiet or self.passthrough) and written//100 > self.written//100:
+            self.print_progress(written - written % 100)
+        self.written = written
+
+        if self.limit and self.written >= self.limit:
+            for stream in self.streams:
+                stream.disconnect()
+
+    def fail(self, error):
         '''
-        Write tweets to JSON output file.
+        Keep first error and stop all streams.
         '''
-        with open(OUTPUT, 'a', encoding='utf8') as f:
-            json.dump(data, f, sort_keys=True)#, indent=4)
-            f.write('\n')
+        print('Error:', repr(error), file=stderr)
+        self.error = self.error or error
+        for stream in self.streams:
+            stream.disconnect()
 
-    def print_tweet(data):
+    def print_tweet(self, data):
         '''
         Print captured tweet on terminal screen.
         '''
@@ -140,39 +359,196 @@ def load_tweet(data):
         tweet_username = '@' + data['user']['screen_name']
         print(tweet_username, str(' ')*int(20-len(tweet_username)), tweet_text, '(' + data['id_str'] + ')')
 
-    global CAPTURED, TOTAL_ATS, TOTAL_RTS, stream
-
-    is_at = True if data['in_reply_to_status_id'] else False # tweet_text.startswith('@')
-    is_rt = True if 'retweeted_status' in data else False # tweet_text.startswith('RT @')
-    is_tweet = all(not i for i in [is_at, is_rt])
-    TOTAL_ATS += 1 if is_at else 0
-    TOTAL_RTS += 1 if is_rt else 0
-
-    if is_tweet or (is_at and STREAM_ATS) or (is_rt and STREAM_RTS):
-        CAPTURED += 1
-
-        # print stdout
-        if QUIET:
-            print('Got', CAPTURED, 'tweets (' +\
-              str("%0.2f"%(TOTAL_RTS*100/CAPTURED)) + '% RTs and ' +\
-              str("%0.2f"%(TOTAL_ATS*100/CAPTURED)) + '% @-messages).')\
-            if (CAPTURED/100).is_integer() else None
-        else: print_tweet(data)
-
-        # write to file
-        if OUTPUT:
-            write_tweet_json(data)
-
-        # append to array
-        if POST_URL:
-            tweet = json.dumps(data)
-            TWEETS.append(tweet)
-
-            # send to URL and reset var
-            if CAPTURED >= LIMIT or len(TWEETS) == INTERVAL:
-                send_tweets() if bool(POST_URL) else None
-                flush_tweets()
-
-    if LIMIT and CAPTURED >= LIMIT:
-        print('\nGot', CAPTURED, 'total tweets.')
-        stream.disconnect()
\ No newline at end of file
+    def print_progress(self, count):
+        '''
+        Print written tweets count and types.
+        '''
+        captured = sum(s.captured for s in self.streams) or 1
+        total_rts = sum(s.total_rts for s in self.streams)
+        total_ats = sum(s.total_ats for s in self.streams)
+        print('Got', count, 'tweets (' +\
+          str("%0.2f"%(total_rts*100/captured)) + '% RTs and ' +\
+          str("%0.2f"%(total_ats*100/captured)) + '% @-messages).')
+
+    def close(self):
+        '''
+        Wait for queued tweets to be written
+        and sent, then close the output file.
+        '''
+        self.queue.put(None) # drained even after errors
+        self.writer.join()
+        self.sink.close() if self.sink else None
+        self.database.commit() if self.database and not self.error else None
+        self.output.close() if self.output else None
+        if self.error:
+            raise self.error
+
+def stream_output(output='.', compression=None, max_bytes=None, max_seconds=None, layout=None):
+    '''
+    Return file path or rotating segments to stream to
+    in output folder, and folder for batches failing to post.
+    '''
+    if not exists(output):
+        makedirs(output)
+
+    spill_dir = abspath(output+'/spill')
+
+    if max_bytes or max_seconds or layout:
+        return RotatingFile(abspath(output), 'tweets.json',
+                            max_bytes=max_bytes,
+                            max_seconds=max_seconds,
+                            layout=layout,
+                            compression=compression), spill_dir
+
+    return abspath(output+'/tweets.json'+SUFFIXES.get(compression, '')), spill_dir
+
+def stream_tweets(query="",
+    stream_type='filter',
+    app_key=APP_KEY,
+    app_secret=APP_SECRET,
+    oauth_token=OAUTH_TOKEN,
+    oauth_secret=OAUTH_SECRET,
+    ats=STREAM_ATS,
+    rts=STREAM_RTS,
+    limit=None,
+    interval=10,
+    output='.',
+    post_url=None,
+    quiet=False,
+    compression=None,
+    passthrough=False,
+    queue_size=10000,
+    max_bytes=None,
+    max_seconds=None,
+    layout=None,
+    database=None,
+    chunk_size=65536):
+    '''
+    Stream tweets to "tweets.json" in output path, set
+    compression as 'gzip' or 'zstd' to write compressed.
+    Returns the stream object with its counters.
+    '''
+    output, spill_dir = stream_output(output, compression, max_bytes, max_seconds, layout)
+
+    # requires authentication as of Twitter API v1.1
+    stream = Stream(app_key, app_secret, oauth_token, oauth_secret,
+                    output=output,
+                    post_url=post_url,
+                    limit=limit,
+                    interval=interval,
+                    quiet=quiet,
+                    ats=ats,
+                    rts=rts,
+                    passthrough=passthrough,
+                    compression=compression,
+                    queue_size=queue_size,
+                    database=database,
+                    chunk_size=chunk_size,
+                    spill_dir=spill_dir)
+
+    try:
+        if (not query) or (stream_type == 'sample'):
+            stream.statuses.sample()
+
+        elif stream_type == 'filter': # default
+            stream.statuses.filter(track=query)
+
+    finally: # write and send remaining data
+        stream.close()
+
+    print('\nGot', stream.captured, 'total tweets.')
+    return stream
+
+    # stream.site(follow='twitter')
+    # stream.user()
+
+def stream_sharded(query,
+    tokens=TWITTER_TOKENS,
+    ats=STREAM_ATS,
+    rts=STREAM_RTS,
+    limit=None,
+    interval=10,
+    output='.',
+    post_url=None,
+    quiet=True,
+    compression=None,
+    passthrough=False,
+    queue_size=10000,
+    max_bytes=None,
+    max_seconds=None,
+    layout=None,
+    dedupe=100000,
+    database=None,
+    chunk_size=65536):
+    '''
+    Split keywords (list or comma-separated string) across
+    tokens, streaming on one connection per token and
+    merging all to a single deduplicated output.
+    Returns the writer object with streams and counters.
+    '''
+    keywords = query if isinstance(query, list) else query.split(',')
+    keywords = [k.strip() for k in keywords if k.strip()]
+    shards = [keywords[i::len(tokens)] for i in range(len(tokens))]
+
+    output, spill_dir = stream_output(output, compression, max_bytes, max_seconds, layout)
+
+    writer = StreamWriter(output=output,
+                          post_url=post_url,
+                          interval=interval,
+                          quiet=quiet,
+                          passthrough=passthrough,
+                          compression=compression,
+                          queue_size=queue_size,
+                          limit=limit,
+                          dedupe=dedupe,
+                          database=database,
+                          spill_dir=spill_dir)
+
+    stop = Event()
+
+    def run(stream, track):
+        '''
+        Keep connection open, reconnecting
+        with backoff on network errors.
+        '''
+        while not stop.is_set():
+            try: stream.statuses.filter(track=','.join(track))
+            except Exception as e:
+                if writer.error:
+                    break
+                print('Warning:', e)
+                stream.on_timeout()
+            if (limit and writer.written >= limit) or writer.error:
+                break
+
+    threads = []
+    for token, track in zip(tokens, shards):
+        if track:
+            stream = Stream(*token[:4], ats=ats, rts=rts, passthrough=passthrough, writer=writer,
+                            chunk_size=chunk_size)
+            threads.append(Thread(target=run, args=(stream, track), daemon=True))
+
+    print('Streaming', len(keywords), 'keywords on', len(threads), 'connections...')
+
+    try:
+        for t in threads:
+            t.start()
+        while any(t.is_alive() for t in threads):
+            for t in threads:
+                t.join(1)
+
+    except KeyboardInterrupt:
+        print('Finishing...')
+        stop.set()
+        for stream in writer.streams:
+            stream.disconnect()
+
+    finally: # write and send remaining data
+        writer.close()
+
+    for i, stream in enumerate(writer.streams):
+        print('Connection', str(i+1) + ':', stream.captured, 'tweets.')
+    print('\nGot', writer.written, 'total tweets',
+          '(' + str(writer.duplicates), 'duplicates skipped).')
+
+    return writer
@@ -0,0 +1,256 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+'''
+Build tweet and user objects as returned by the API,
+deterministic for a given ID, e.g. for mockapi.py.
+
+Tweet IDs are read as snowflakes, so "created_at"
+follows the ID as on Twitter:
+
+    tweet = make_tweet(snowflake(1569888005), 'hello world')
+
+Use write_corpus() for a JSON lines dataset of any size,
+with retweets, quotes, replies, places, media and long
+texts at the ratios set, the same for the same seed:
+
+    write_corpus('tweets.json.gz', 1000000, retweets=0.5)
+'''
+
+from collections import deque
+from functools import lru_cache
+from multiprocessing import Pool, cpu_count
+from random import Random
+from zlib import crc32
+
+from jsonlib import dumps
+from ziplib import open_file
+
+EPOCH = 1288834974657 # Twitter snowflake epoch (ms)
+
+DAYS = ['Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat', 'Sun']
+MONTHS = ['Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun', 'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec']
+
+WORDS = ['política', 'constituição', 'governo', 'presidente', 'congresso', 'senado', 'eleição',
+    'democracia', 'voto', 'reforma', 'brasil', 'ciência', 'pesquisa', 'universidade', 'notícia',
+    'hoje', 'agora', 'povo', 'lei', 'projeto', 'economia', 'saúde', 'educação', 'the', 'vote',
+    'election', 'news', 'today', 'people', 'law', 'state', 'crisis', 'debate', 'rt', 'via']
+
+# name, full name, country, country code, bounding box
+PLACES = [('São Paulo', 'São Paulo, Brazil', 'Brazil', 'BR', [[[-46.83, -24.01], [-46.83, -23.36], [-46.37, -23.36], [-46.37, -24.01]]]),
+    ('Vitória', 'Vitória, Brazil', 'Brazil', 'BR', [[[-40.36, -20.33], [-40.36, -20.23], [-40.28, -20.23], [-40.28, -20.33]]]),
+    ('Lisboa', 'Lisboa, Portugal', 'Portugal', 'PT', [[[-9.23, 38.69], [-9.23, 38.80], [-9.09, 38.80], [-9.09, 38.69]]]),
+    ('London', 'London, England', 'United Kingdom', 'GB', [[[-0.51, 51.28], [-0.51, 51.69], [0.33, 51.69], [0.33, 51.28]]]),
+    ('Manhattan', 'Manhattan, NY', 'United States', 'US', [[[-74.03, 40.68], [-74.03, 40.88], [-73.91, 40.88], [-73.91, 40.68]]]),
+    ('Buenos Aires', 'Buenos Aires, Argentina', 'Argentina', 'AR', [[[-58.53, -34.71], [-58.53, -34.53], [-58.34, -34.53], [-58.34, -34.71]]])]
+
+# lines made from each seed, so blocks can be made apart
+BLOCK = 10000
+
+# share of tweets of each kind in write_corpus()
+RATIOS = {'retweets': 0.4, 'quotes': 0.1, 'replies': 0.15, 'places': 0.03, 'media': 0.1, 'extended': 0.2}
+
+SOURCES = ['<a href="http://twitter.com/download/android" rel="nofollow">Twitter for Android</a>',
+    '<a href="http://twitter.com/download/iphone" rel="nofollow">Twitter for iPhone</a>',
+    '<a href="https://mobile.twitter.com" rel="nofollow">Twitter Web App</a>']
+
+def snowflake(timestamp, sequence=0):
+    '''
+    Return tweet ID from Unix timestamp.
+    '''
+    return (int(timestamp * 1000) - EPOCH) << 22 | sequence
+
+def created_at(tweet_id):
+    '''
+    Return "created_at" string from tweet ID.
+    '''
+    t = ((tweet_id >> 22) + EPOCH) // 1000
+    days, seconds = divmod(t, 86400)
+    y, m, d = civil_date(days)
+    return '%s %s %02d %02d:%02d:%02d +0000 %d' % (DAYS[(days + 3) % 7], MONTHS[m - 1], d,
+        seconds // 3600, seconds % 3600 // 60, seconds % 60, y)
+
+def civil_date(days):
+    '''
+    Return (year, month, day) from days since 1970-01-01.
+    '''
+    z = days + 719468
+    era = z // 146097
+    doe = z - era * 146097
+    yoe = (doe - doe // 1460 + doe // 36524 - doe // 146096) // 365
+    doy = doe - (365 * yoe + yoe // 4 - yoe // 100)
+    mp = (5 * doy + 2) // 153
+    d = doy - (153 * mp + 2) // 5 + 1
+    m = mp + 3 if mp < 10 else mp - 9
+    return yoe + era * 400 + (m <= 2), m, d
+
+def make_user(user_id, screen_name=None):
+    '''
+    Return user object for ID.
+    '''
+    r = Random(user_id)
+    screen_name = screen_name or 'user' + str(user_id)
+    followers = int(r.paretovariate(1.2) * 50)
+    return {'id': user_id,
+            'id_str': str(user_id),
+            'name': screen_name.title(),
+            'screen_name': screen_name,
+            'location': r.choice(['', 'Vitória, Brasil', 'São Paulo', 'Lisboa', 'London']),
+            'description': ' '.join(r.choice(WORDS) for i in range(r.randint(0, 12))),
+            'url': r.choice([None, 'https://example.org/' + screen_name]),
+            'protected': False,
+            'followers_count': followers,
+            'friends_count': int(r.paretovariate(1.5) * 80),
+            'listed_count': followers // 100,
+            'created_at': created_at(snowflake(1230768000 + user_id % 315360000)),
+            'favourites_count': r.randint(0, 50000),
+            'verified': followers > 100000,
+            'statuses_count': r.randint(1, 100000),
+            'lang': None,
+            'time_zone': None,
+            'profile_image_url': 'http://pbs.twimg.com/profile_images/' + str(user_id) + '/normal.jpg',
+            'default_profile': r.random() < 0.3,
+            'default_profile_image': r.random() < 0.05}
+
+def make_tweet(tweet_id, text=None, user=None, lang='pt', extended=True):
+    '''
+    Return tweet object for ID, with text
+    and user object generated if not set,
+    as "full_text" (extended mode) or "text".
+    '''
+    r = Random(tweet_id)
+    user = user or make_user(r.randint(1, 10**9))
+    text = text or ' '.join(r.choice(WORDS) for i in range(r.randint(3, 30)))
+    return {'created_at': created_at(tweet_id),
+            'id': tweet_id,
+            'id_str': str(tweet_id),
+            'full_text' if extended else 'text': text,
+            'truncated': False,
+            'display_text_range': [0, len(text)],
+            'entities': {'hashtags': [], 'symbols': [], 'user_mentions': [], 'urls': []},
+            'source': r.choice(SOURCES),
+            'in_reply_to_status_id': None,
+            'in_reply_to_status_id_str': None,
+            'in_reply_to_user_id': None,
+            'in_reply_to_user_id_str': None,
+            'in_reply_to_screen_name': None,
+            'user': user,
+            'geo': None,
+            'coordinates': None,
+            'place': None,
+            'contributors': None,
+            'is_quote_status': False,
+            'retweet_count': int(r.paretovariate(1.5)) - 1,
+            'favorite_count': int(r.paretovariate(1.3)) - 1,
+            'favorited': False,
+            'retweeted': False,
+            'lang': lang}
+
+def make_text(r, length=140):
+    '''
+    Return random words up to length characters.
+    '''
+    text = ' '.join(r.choices(WORDS, k=length // 3 + 1))
+    return text[:text.rfind(' ', 0, length + 1)] if len(text) > length else text
+
+@lru_cache(maxsize=65536)
+def cached_user(user_id):
+    return make_user(user_id)
+
+def make_corpus(lines, seed=0, users=100000, start=1569888000, rate=10, first=0, **ratios):
+    '''
+    Yield tweets in order of ID, rate per second from start,
+    by users chosen from a long-tailed distribution, with
+    retweets, quotes, replies, places, media and extended
+    text at the ratios set (see RATIOS).
+
+    Extended tweets have "full_text" longer than 140
+    characters, others "text" as on compatibility mode.
+    Retweets truncate long texts with an ellipsis.
+
+    Set first as a multiple of BLOCK to start from that line.
+    '''
+    ratios = dict(RATIOS, **ratios)
+    shared = ratios['retweets'] + ratios['quotes']
+
+    for n in range(first, first + lines):
+        if n == first or n % BLOCK == 0:
+            r = Random(seed * 1000003 + n // BLOCK)
+            recent = deque(maxlen=1000) # tweets to retweet, quote or reply to
+
+        tweet_id = snowflake(start + n / rate, n % 4096)
+        user = cached_user(int(users ** r.random()) + 1000)
+        kind = r.random()
+        extended = r.random() < ratios['extended']
+        text = make_text(r, r.randint(141, 280) if extended else r.randint(20, 140))
+        original = r.choice(recent) if recent and kind < shared + ratios['replies'] else None
+
+        if original and kind < ratios['retweets']:
+            original = original.get('retweeted_status', original)
+            text = 'RT @' + original['user']['screen_name'] + ': ' + original.get('full_text', original.get('text'))
+            text = text[:139] + '…' if len(text) > 140 else text
+            tweet = make_tweet(tweet_id, text, user, extended=False)
+            tweet['retweeted_status'] = original
+            tweet['retweet_count'] = original['retweet_count']
+            tweet['favorite_count'] = 0
+            yield tweet
+            continue
+
+        tweet = make_tweet(tweet_id, text, user, extended=extended)
+        tweet['lang'] = r.choice(['pt', 'pt', 'pt', 'en', 'es', 'und'])
+
+        if original and kind < shared:
+            tweet['is_quote_status'] = True
+            tweet['quoted_status_id'] = original['id']
+            tweet['quoted_status_id_str'] = original['id_str']
+            tweet['quoted_status'] = {k: v for k, v in original.items() if k != 'quoted_status'} # one level
+
+        elif original:
+            tweet['in_reply_to_status_id'] = original['id']
+            tweet['in_reply_to_status_id_str'] = original['id_str']
+            tweet['in_reply_to_user_id'] = original['user']['id']
+            tweet['in_reply_to_user_id_str'] = original['user']['id_str']
+            tweet['in_reply_to_screen_name'] = original['user']['screen_name']
+
+        if r.random() < ratios['places']:
+            name, full_name, country, country_code, bounding_box = r.choice(PLACES)
+            tweet['place'] = {'id': str(crc32(full_name.encode('utf8'))), 'place_type': 'city', 'name': name,
+                              'full_name': full_name, 'country_code': country_code, 'country': country,
+                              'bounding_box': {'type': 'Polygon', 'coordinates': bounding_box}}
+
+        if r.random() < ratios['media']:
+            media_id = tweet_id + 1
+            tweet['entities']['media'] = [{'id': media_id,
+                                           'id_str': str(media_id),
+                                           'media_url': 'http://pbs.twimg.com/media/' + str(media_id) + '.jpg',
+                                           'media_url_https': 'https://pbs.twimg.com/media/' + str(media_id) + '.jpg',
+                                           'expanded_url': 'https://twitter.com/' + user['screen_name'] +
+                                                           '/status/' + str(tweet_id) + '/photo/1',
+                                           'type': 'photo'}]
+
+        recent.append(tweet)
+        yield tweet
+
+def write_corpus(filename, lines, compression=None, processes=1, **kwargs):
+    '''
+    Write tweets from make_corpus() as JSON lines,
+    compressed as set by extension or compression,
+    with blocks made by a pool of processes if set
+    (None for all CPUs), the same for any number.
+    '''
+    blocks = [(n, min(BLOCK, lines - n), kwargs) for n in range(0, lines, BLOCK)]
+
+    with open_file(filename, 'wt', compression) as f:
+        if processes == 1:
+            for data in map(corpus_block, blocks):
+                f.write(data)
+        else:
+            with Pool(processes or cpu_count()) as pool:
+                for data in pool.imap(corpus_block, blocks):
+                    f.write(data)
+
+    return filename
+
+def corpus_block(args):
+    first, lines, kwargs = args
+    return ''.join(dumps(tweet) + '\n' for tweet in make_corpus(lines, first=first, **kwargs))
@@ -43,7 +43,7 @@ def trending_topics(query, app_keys=TWITTER_KEYS, post_url=None, show_all_topics
                 break
 
     print('Authenticating...')
-    twitter = twython_auth(app_keys)
+    twitter = twython_auth(app_keys, 'trends')
 
     trending = twitter.get_place_trends(id=query) # get trending topics
     trending_topics = defaultdict(int) # set it as dictionary
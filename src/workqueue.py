@@ -0,0 +1,217 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+'''
+Distribute queries, ID chunks or users to collect among
+workers through a queue on a SQLite file, e.g. on a
+folder shared by several machines (with file locking):
+
+    put_queue('queries.txt', 'queue.db', query_type='tweets')
+    run_worker('queue.db', query_type='tweets', output='data')
+
+Workers claim items for lease seconds, renewed by a
+heartbeat thread while collecting, and report them as
+done. Items of workers that stopped renewing are claimed
+again by others when the lease expires, up to
+max_attempts times before being marked as failed.
+
+Interrupted workers (SIGINT or SIGTERM) return their
+items to the queue. Each worker collects with its own
+TWITTER_KEYS (or the app_keys set) to a folder named
+after host and process, appending on later runs.
+Use run_workers() to start several processes locally.
+'''
+
+from multiprocessing import Process
+from os import getpid
+from os.path import join
+from signal import SIGINT, SIGTERM, signal
+from socket import gethostname
+from threading import Event, Lock, Thread
+from time import time
+
+import sqlite3
+
+from collect import collect_twitter, read_query, split_list
+from jsonlib import dumps, loads
+
+try: from config import TWITTER_KEYS
+except: TWITTER_KEYS = []
+
+class WorkQueue():
+    '''
+    Items with status (pending, leased, done, failed),
+    owner, lease expiry and attempts on a SQLite table.
+    '''
+    def __init__(self, filename='queue.db', lease=300, max_attempts=3):
+        self.lease = lease
+        self.max_attempts = max_attempts
+        self.lock = Lock()
+        self.db = sqlite3.connect(filename, timeout=60, isolation_level=None, check_same_thread=False)
+        self.db.execute('CREATE TABLE IF NOT EXISTS queue (id INTEGER PRIMARY KEY, item TEXT UNIQUE,'
+                        " status TEXT DEFAULT 'pending', owner TEXT, expires REAL DEFAULT 0,"
+                        ' attempts INT DEFAULT 0, updated REAL)')
+
+    def put(self, items):
+        '''
+        Add items not queued yet, e.g. on a new run.
+        '''
+        with self.lock:
+            self.db.execute('BEGIN IMMEDIATE')
+            self.db.executemany('INSERT OR IGNORE INTO queue (item, updated) VALUES (?, ?)',
+                                [(dumps(i), time()) for i in items])
+            self.db.execute('COMMIT')
+
+    def claim(self, owner, n=1):
+        '''
+        Lease up to n pending or expired items, marking
+        expired ones out of attempts as failed, and
+        returning list of (id, item).
+        '''
+        now = time()
+        with self.lock:
+            self.db.execute('BEGIN IMMEDIATE') # lock for writing
+            self.db.execute("UPDATE queue SET status='failed', expires=0, updated=? WHERE status='leased'"
+                            ' AND expires<? AND attempts>=?', (now, now, self.max_attempts))
+            rows = self.db.execute("SELECT id, item FROM queue WHERE status='pending'"
+                                   " OR (status='leased' AND expires<? AND attempts<?) ORDER BY id LIMIT ?",
+                                   (now, self.max_attempts, n)).fetchall()
+            self.db.executemany("UPDATE queue SET status='leased', owner=?, expires=?,"
+                                ' attempts=attempts+1, updated=? WHERE id=?',
+                                [(owner, now + self.lease, now, r[0]) for r in rows])
+            self.db.execute('COMMIT')
+        return [(r[0], loads(r[1])) for r in rows]
+
+    def heartbeat(self, owner, ids):
+        '''
+        Renew lease of items still owned.
+        '''
+        self.update(owner, ids, 'leased', time() + self.lease)
+
+    def complete(self, owner, ids):
+        self.update(owner, ids, 'done')
+
+    def fail(self, owner, ids):
+        '''
+        Release items to be claimed again,
+        or mark those out of attempts.
+        '''
+        with self.lock:
+            self.db.execute('BEGIN IMMEDIATE')
+            for i in ids:
+                self.db.execute("UPDATE queue SET status=CASE WHEN attempts>=? THEN 'failed' ELSE 'pending' END,"
+                                ' expires=0, updated=? WHERE id=? AND owner=?', (self.max_attempts, time(), i, owner))
+            self.db.execute('COMMIT')
+
+    def release(self, owner, ids):
+        '''
+        Return items unfinished on interrupt.
+        '''
+        with self.lock:
+            self.db.execute('BEGIN IMMEDIATE')
+            self.db.executemany("UPDATE queue SET status='pending', expires=0, attempts=attempts-1,"
+                                ' updated=? WHERE id=? AND owner=?', [(time(), i, owner) for i in ids])
+            self.db.execute('COMMIT')
+
+    def update(self, owner, ids, status, expires=0):
+        with self.lock:
+            self.db.execute('BEGIN IMMEDIATE')
+            self.db.executemany('UPDATE queue SET status=?, expires=?, updated=? WHERE id=? AND owner=?'
+                                " AND status='leased'", [(status, expires, time(), i, owner) for i in ids])
+            self.db.execute('COMMIT')
+
+    def stats(self):
+        '''
+        Return number of items by status.
+        '''
+        with self.lock:
+            return dict(self.db.execute('SELECT status, COUNT(*) FROM queue GROUP BY status').fetchall())
+
+    def close(self):
+        self.db.close()
+
+def put_queue(query, filename='queue.db', query_type='tweets', separator=None, chunksize=100):
+    '''
+    Queue queries from list, string or file,
+    with IDs and users in chunks of 100.
+    '''
+    query = read_query(query, separator)
+
+    if query_type in ('ids', 'users'):
+        query = list(split_list(query, chunksize))
+
+    queue = WorkQueue(filename)
+    queue.put(query)
+    print('Queued', len(query), 'items:', queue.stats())
+    queue.close()
+
+def run_worker(filename='queue.db', app_keys=TWITTER_KEYS, query_type='tweets', output='.',
+    batch_size=10, lease=300, **kwargs):
+    '''
+    Collect items claimed from queue until none is left,
+    passing other arguments to collect_twitter().
+    '''
+    owner = gethostname() + '_' + str(getpid())
+    output = join(output, owner)
+    queue = WorkQueue(filename, lease)
+    claimed = []
+    stop = Event()
+
+    def renew():
+        while not stop.wait(lease / 3):
+            queue.heartbeat(owner, claimed)
+
+    def interrupt(signum, frame):
+        stop.set()
+        raise KeyboardInterrupt
+
+    try: # collect_twitter() returns on interrupt
+        signal(SIGINT, interrupt)
+        signal(SIGTERM, interrupt)
+    except ValueError: # not on main thread
+        pass
+
+    Thread(target=renew, daemon=True).start()
+
+    try:
+        while not stop.is_set():
+            items = queue.claim(owner, batch_size)
+            if not items:
+                break
+
+            claimed[:] = [i for i, item in items]
+            query = [q for i, item in items for q in (item if isinstance(item, list) else [item])]
+
+            try:
+                collect_twitter(query, app_keys, query_type, output=output,
+                                checkpoint=join(output, 'checkpoint.json'), **kwargs)
+                if stop.is_set():
+                    queue.release(owner, claimed)
+                else: queue.complete(owner, claimed)
+            except KeyboardInterrupt:
+                queue.release(owner, claimed)
+            except Exception as e:
+                print('Warning:', str(e))
+                queue.fail(owner, claimed)
+            claimed[:] = []
+
+    finally:
+        stop.set()
+        print('Worker', owner, 'finished:', queue.stats())
+        queue.close()
+
+def run_workers(filename='queue.db', processes=2, app_keys=TWITTER_KEYS, **kwargs):
+    '''
+    Start worker processes on this machine, each with
+    a share of the keys if there are enough of them.
+    '''
+    workers = []
+
+    for n in range(processes):
+        keys = app_keys[n::processes] if len(app_keys) >= processes else app_keys
+        p = Process(target=run_worker, args=(filename, keys), kwargs=kwargs)
+        p.start()
+        workers.append(p)
+
+    for p in workers:
+        p.join()
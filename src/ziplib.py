@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+'''
+Functions for reading and writing gzip or zstd
+compressed files, chosen by file extension or
+set explicitly as compression='gzip' or 'zstd'.
+
+Writing compresses data on a background thread,
+so the caller only pays for buffering each line.
+'''
+
+import gzip
+import io
+
+from queue import Queue
+from threading import Thread
+
+EXTENSIONS = {'.gz': 'gzip', '.gzip': 'gzip', '.zst': 'zstd', '.zstd': 'zstd'}
+SUFFIXES = {'gzip': '.gz', 'zstd': '.zst'}
+
+class ThreadedWriter(io.RawIOBase):
+    '''
+    Raw file object which hands written bytes to a
+    thread writing them to a (compressed) file object.
+    '''
+    def __init__(self, fileobj, queue_size=64):
+        self.fileobj = fileobj
+        self.queue = Queue(maxsize=queue_size)
+        self.error = None
+        self.thread = Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def run(self):
+        while True:
+            data = self.queue.get()
+            if data is None:
+                break
+            try: self.fileobj.write(data)
+            except Exception as e:
+                self.error = e
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        if self.error:
+            raise self.error
+        self.queue.put(bytes(data))
+        return len(data)
+
+    def close(self):
+        if not self.closed:
+            self.queue.put(None)
+            self.thread.join()
+            self.fileobj.close()
+        super().close()
+        if self.error:
+            raise self.error
+
+def get_compression(filename, compression=None):
+    '''
+    Return compression type set or from file extension.
+    '''
+    if compression:
+        return compression
+    for ext, c in EXTENSIONS.items():
+        if str(filename).endswith(ext):
+            return c
+
+def strip_compression(filename):
+    '''
+    Return file name without compression extension.
+    '''
+    for ext in EXTENSIONS:
+        if filename.endswith(ext):
+            return filename[:-len(ext)]
+    return filename
+
+def open_file(filename, mode='rt', compression=None, encoding='utf8', newline=None,
+    level=None, threaded=True, buffer_size=1024**2):
+    '''
+    Open a plain or compressed file for reading or writing,
+    in text or binary mode, returning a file object.
+    '''
+    compression = get_compression(filename, compression)
+    binary = 'b' in mode
+    raw_mode = mode.replace('t', '').replace('b', '') + 'b'
+
+    if not compression:
+        if binary:
+            return open(filename, mode)
+        return open(filename, mode, encoding=encoding, newline=newline)
+
+    if compression == 'gzip':
+        fileobj = gzip.open(filename, raw_mode, compresslevel=level or 6)
+
+    elif compression == 'zstd':
+        import zstandard as zstd
+
+        if raw_mode == 'rb':
+            fileobj = zstd.ZstdDecompressor().stream_reader(open(filename, 'rb'), closefd=True)
+        else: fileobj = zstd.ZstdCompressor(level=level or 3).stream_writer(open(filename, raw_mode), closefd=True)
+
+    else: raise ValueError('unknown compression "%s".' % compression)
+
+    if raw_mode == 'rb':
+        fileobj = io.BufferedReader(fileobj, buffer_size) if compression == 'zstd' else fileobj
+
+    elif threaded:
+        fileobj = io.BufferedWriter(ThreadedWriter(fileobj), buffer_size)
+
+    if binary:
+        return fileobj
+    return io.TextIOWrapper(fileobj, encoding=encoding, newline=newline)